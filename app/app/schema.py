@@ -0,0 +1,84 @@
+"""
+OpenAPI schema generation.
+
+Only imported through the lazily resolved schema view and build_schema, so
+drf_spectacular is loaded when a schema is needed, not when a worker or
+management command starts.
+"""
+import gzip
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from app.schema_generator import SchemaGenerator
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+_rendered = {} #format -> (body, gzipped body, etag), filled once per process
+
+
+def schema_path(fmt):
+    """Return where build_schema writes the schema in the given format."""
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, f'openapi.{fmt}')
+
+
+def render_schemas():
+    """Generate the schema from the code and render it in every format."""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    return {
+        fmt: renderer().render(schema, renderer_context={})
+        for fmt, renderer in RENDERERS.items()
+    }
+
+
+def get_rendered_schema(fmt):
+    """Return (body, gzipped body, etag) for the schema, computed once.
+
+    Reads the file written by build_schema when there is one and generates
+    the schema otherwise. DEBUG always generates, the dev server reloads on
+    code changes so the memoized copy can't go stale.
+    """
+    if fmt not in _rendered:
+        path = schema_path(fmt)
+        if not settings.DEBUG and os.path.exists(path):
+            with open(path, 'rb') as f:
+                body = f.read()
+        else:
+            body = render_schemas()[fmt]
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        _rendered[fmt] = (body, gzip.compress(body, mtime=0), etag)
+    return _rendered[fmt]
+
+
+def clear_schema_cache():
+    """Forget the memoized schema, the next request loads it again."""
+    _rendered.clear()
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """Serve the prebuilt schema with a strong ETag, gzipped when accepted."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        body, gzipped, etag = get_rendered_schema(request.accepted_renderer.format)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(gzipped, content_type=request.accepted_media_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(body, content_type=request.accepted_media_type)
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        return response
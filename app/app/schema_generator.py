@@ -0,0 +1,13 @@
+"""
+OpenAPI schema generator named by SPECTACULAR_SETTINGS['DEFAULT_GENERATOR_CLASS'].
+
+Kept apart from app.schema: drf_spectacular.views imports the generator
+setting at import time, so a module importing those views can't define it.
+"""
+from drf_spectacular.generators import SchemaGenerator as BaseSchemaGenerator
+
+import recipe.schema  # noqa: F401 registers the recipe view extensions
+
+
+class SchemaGenerator(BaseSchemaGenerator):
+    """Generator that loads every app's view annotations first."""
@@ -38,12 +38,13 @@ ALLOWED_HOSTS.extend(
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig', #admin modules are discovered in app.urls, not on every startup
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', #renders the OpClass() index expressions in core.models
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -111,6 +113,61 @@ if 'test' in sys.argv and 'GITHUB_ACTIONS' in os.environ:
         }
     }
 
+# Read replicas of the default database, DB_REPLICA_HOSTS=host1,host2.
+# Tests read them through the default connection (TEST MIRROR).
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Recipe data is sharded by user, see core.sharding. DB_SHARD_HOSTS lists
+# host or host/dbname entries, added as shard_N next to default. Each shard
+# gets the full schema with manage.py migrate --database shard_N.
+DATABASE_SHARDS = ['default']
+for index, entry in enumerate(filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')), 1):
+    host, _, name = entry.strip().partition('/')
+    DATABASES[f'shard_{index}'] = dict(
+        DATABASES['default'], HOST=host, NAME=name or DATABASES['default']['NAME']
+    )
+    DATABASE_SHARDS.append(f'shard_{index}')
+
+# Seconds a user's shard is cached, bounds how long a move takes to be seen.
+DATABASE_SHARD_MAP_TIMEOUT = int(os.environ.get('DB_SHARD_MAP_TIMEOUT', 60))
+
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.ReplicaRouter']
+
+# Seconds a client reads from the primary after a write (read-your-writes).
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.2/topics/auth/passwords/
+# The preferred hasher is used for new hashes, the others still verify old
+# ones and get upgraded on the next successful login.
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'core.hashers.TunablePBKDF2PasswordHasher',
+    'argon2': 'core.hashers.TunableArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER
+]
+
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 102400))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 8))
+
+# Logins allowed to hash concurrently on one host, kept below the uwsgi
+# worker count so logins can't take every worker, and how many seconds a
+# login waits for a slot before the API answers 503. See core.hashers.
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2))
+PASSWORD_HASH_WAIT = float(os.environ.get('PASSWORD_HASH_WAIT', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -161,11 +218,51 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = "core.User" #setting the auth user model configuration. tellint it to user User model
 
+# Cache
+# The uwsgi cache is shared memory visible to every worker on the host,
+# see the --cache2 option in scripts/run.sh.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.UWSGICache',
+        'LOCATION': 'default',
+    }
+}
+
+# Hours a soft deleted recipe is kept before manage.py purge_recipes removes it.
+RECIPE_PURGE_AFTER_HOURS = int(os.environ.get('RECIPE_PURGE_AFTER_HOURS', 24))
+
+# Seconds before a failed background job is retried, doubled after every
+# further failure up to JOB_RETRY_MAX_DELAY, see core.jobs.
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+JOB_RETRY_MAX_DELAY = int(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+
+# Seconds a running job may go without reporting progress before it counts
+# as lost (its worker was killed) and is queued again, see core.jobs.
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 600))
+
+# Seconds core.authentication.CachedTokenAuthentication keeps a user cached.
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 300))
+
 REST_FRAMEWORK = {
     # YOUR SETTINGS
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.AnonTokenBucketThrottle',
+        'core.throttling.UserTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.environ.get('THROTTLE_RATE_ANON', '100/min'),
+        'user': os.environ.get('THROTTLE_RATE_USER', '1000/min'),
+        'login': os.environ.get('THROTTLE_RATE_LOGIN', '20/min'),
+    },
 }
 
+# Where manage.py build_schema writes the rendered OpenAPI schema that
+# /api/schema/ serves, it's generated on the first request when missing.
+OPENAPI_SCHEMA_DIR = os.environ.get('OPENAPI_SCHEMA_DIR', os.path.join(STATIC_ROOT, 'schema'))
+
 SPECTACULAR_SETTINGS = {
-    'COMPONENT_SPLIT_REQUEST': True
+    'COMPONENT_SPLIT_REQUEST': True,
+    'DEFAULT_GENERATOR_CLASS': 'app.schema_generator.SchemaGenerator',
 }
\ No newline at end of file
@@ -10,7 +10,13 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# Import the URLconf, views and admin now. Without --lazy-apps uwsgi loads
+# this module once in the master, so forked workers start warm and share
+# the imported code copy-on-write.
+get_resolver().url_patterns
@@ -2,14 +2,58 @@
 Django admin customization.
 """
 
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import widgets
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 # internal imports
 from core import models
+from core.dedupe import find_duplicate_groups
+from core.deletion import delete_user
+from core.jobs import enqueue, retry_jobs
+from core.sharding import is_sharded, shard_for_user, use_shard
 
-class UserAdmin(BaseUserAdmin):
+class BackgroundJobsMixin:
+    """Admin actions that queue core.jobs instead of working in the request."""
+    actions = ['delete_in_background']
+    
+    def get_actions(self, request):
+        """Replace the synchronous delete_selected with the background one."""
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+    
+    def queue_job(self, request, name, **payload):
+        """Enqueue a job and point the admin user at its progress."""
+        job = enqueue(name, **payload)
+        self.message_user(
+            request,
+            _('Queued %(job)s, follow its progress under Jobs.') % {'job': job},
+            messages.SUCCESS,
+        )
+        return job
+    
+    @admin.action(permissions=['delete'], description=_('Delete selected in the background'))
+    def delete_in_background(self, request, queryset):
+        self.queue_job(
+            request,
+            'delete_objects',
+            model=self.model._meta.label_lower,
+            shard=queryset.db,
+            **selection(request, queryset),
+        )
+
+
+class UserAdmin(BackgroundJobsMixin, BaseUserAdmin):
     
     
     """Define the admin pages for users."""
@@ -44,9 +88,253 @@ class UserAdmin(BaseUserAdmin):
                 }
         ),
     )
+    
+    def delete_model(self, request, obj):
+        delete_user(obj) #set based, see core.deletion
+    
+    def get_deleted_objects(self, objs, request):
+        """Summarize what goes with the users instead of listing every row."""
+        model_count = {}
+        for user in objs:
+            with use_shard(shard_for_user(user.pk)):
+                for model in (models.Recipe, models.Tag, models.Ingredient):
+                    name = model._meta.verbose_name_plural
+                    model_count[name] = model_count.get(name, 0) + model.objects.filter(user=user).count()
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return [str(user) for user in objs], model_count, perms_needed, []
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the planner's row estimate for unfiltered big tables."""
+    estimate_threshold = 100000 #below this an exact COUNT(*) is cheap enough
+    
+    def _estimate(self):
+        """Return pg_class.reltuples for the table, -1 when never analyzed."""
+        queryset = self.object_list
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else -1
+    
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where: #filters and searches still get exact counts
+            estimate = self._estimate()
+            if estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+
+def selection(request, queryset):
+    """Return the job payload naming the rows an action was applied to.
+    
+    Rows ticked on the page, at most a page of them, are passed as ids.
+    "Select all" passes the changelist's filters and the newest id instead,
+    the job pages through them, see core.jobs.selected_chunks.
+    """
+    if not forms.BooleanField().to_python(request.POST.get('select_across')):
+        return {'ids': list(queryset.values_list('pk', flat=True))}
+    newest = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    return {
+        'changelist': {
+            'params': request.GET.dict(),
+            'user_id': request.user.pk,
+            'max_id': newest or 0,
+        },
+    }
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick the shard a changelist reads, one query can't span them."""
+    title = _('shard')
+    parameter_name = 'shard'
+    
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.using(self.value())
+        return queryset
+
+
+class LargeTableAdmin(BackgroundJobsMixin, admin.ModelAdmin):
+    """Changelist defaults for tables with millions of rows.
+    
+    The models are sharded by user, see core.sharding. The changelist reads
+    the shard picked in its filter, the object pages the shard holding the
+    object, and actions hand that shard to their jobs.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False #skip the second, unfiltered COUNT(*)
+    list_select_related = ['user']
+    raw_id_fields = ['user'] #no dropdown of every user
+    ordering = ['-id']
+    
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if is_sharded():
+            return [ShardListFilter, *list_filter]
+        return list_filter
+    
+    def object_shard(self, request, object_id):
+        """Return the shard holding the object, ids are unique across shards."""
+        if object_id is None or not is_sharded():
+            return None
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                if self.get_object(request, object_id) is not None:
+                    return alias
+        return None
+    
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        #the raw id fields validate tags and ingredients on the same shard
+        with use_shard(self.object_shard(request, object_id)):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+    
+    def delete_view(self, request, object_id, extra_context=None):
+        with use_shard(self.object_shard(request, object_id)):
+            return super().delete_view(request, object_id, extra_context)
+    
+    def history_view(self, request, object_id, extra_context=None):
+        with use_shard(self.object_shard(request, object_id)):
+            return super().history_view(request, object_id, extra_context)
+
+
+class RecipeActionForm(ActionForm):
+    """Action bar with the new owner for reassign_owner."""
+    user_id = forms.IntegerField(required=False, label=_('New owner id'))
+
+
+class RecipeAdmin(LargeTableAdmin):
+    """Define the admin pages for recipes."""
+    list_display = ['title', 'user', 'time_minutes', 'price', 'deleted_at']
+    raw_id_fields = ['user', 'tags', 'ingredients'] #the M2M widgets would list every tag
+    search_fields = ['^title'] #prefix search, served by the upper(title) index
+    action_form = RecipeActionForm
+    actions = LargeTableAdmin.actions + ['reassign_owner']
+    list_filter = [('deleted_at', admin.EmptyFieldListFilter)]
+    
+    def get_queryset(self, request):
+        """Include soft deleted recipes, they are kept until purged."""
+        qs = models.Recipe.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            qs = qs.order_by(*ordering)
+        return qs
+    
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        #the admin hides M2Ms with an explicit through model, but RecipeTag and
+        #RecipeIngredient only exist to partition the tables, so keep editing
+        #them with set() like before (which also keeps recipe_count in sync)
+        if db_field.name in self.raw_id_fields:
+            kwargs['widget'] = widgets.ManyToManyRawIdWidget(
+                db_field.remote_field, self.admin_site, using=kwargs.get('using')
+            )
+            return db_field.formfield(**kwargs)
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+    
+    @admin.action(permissions=['change'], description=_('Reassign selected to the new owner id'))
+    def reassign_owner(self, request, queryset):
+        user_id = request.POST.get('user_id')
+        if not user_id or not get_user_model().objects.filter(pk=user_id).exists():
+            self.message_user(request, _('Enter the id of an existing user.'), messages.ERROR)
+            return
+        if shard_for_user(int(user_id)) != queryset.db:
+            self.message_user(
+                request,
+                _('The new owner is on another shard, move them with move_user first.'),
+                messages.ERROR,
+            )
+            return
+        self.queue_job(
+            request,
+            'reassign_recipes',
+            user_id=int(user_id),
+            shard=queryset.db,
+            **selection(request, queryset),
+        )
+
+
+class RecipeAttrAdmin(LargeTableAdmin):
+    """Define the admin pages for tags and ingredients."""
+    list_display = ['name', 'user', 'recipe_count']
+    search_fields = ['^name'] #prefix search, served by the upper(name) index
+    actions = LargeTableAdmin.actions + ['merge_duplicates']
+    
+    @admin.action(permissions=['change'], description=_('Merge selected near-duplicates'))
+    def merge_duplicates(self, request, queryset):
+        per_user = {}
+        for pk, user_id, name, count in queryset.values_list('pk', 'user_id', 'name', 'recipe_count'):
+            per_user.setdefault(user_id, []).append((pk, name, count))
+        groups = [
+            group
+            for items in per_user.values()
+            for group in find_duplicate_groups(items)
+        ]
+        if not groups:
+            self.message_user(request, _('No duplicates among the selection.'), messages.WARNING)
+            return
+        self.queue_job(
+            request,
+            'merge_attrs',
+            model=self.model._meta.label_lower,
+            groups=groups,
+            shard=queryset.db,
+        )
+
+
+class IngredientAdmin(RecipeAttrAdmin):
+    """Define the admin pages for ingredients."""
+    raw_id_fields = ['user', 'catalog'] #the catalog holds every distinct name
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Prefix search the catalog names and the differing spellings.
+        
+        Each side is served by its upper() index, upper(coalesce(...)) on
+        the annotated name could not use either.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        catalog = models.CatalogIngredient.objects.filter(name__istartswith=term)
+        return queryset.filter(
+            Q(spelling__isnull=True, catalog__in=catalog) | Q(spelling__istartswith=term)
+        ), False
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Read only view of background jobs and their progress."""
+    list_display = [
+        'id', 'name', 'status', 'progress', 'total', 'attempts', 'run_after',
+        'created_at', 'finished_at',
+    ]
+    list_filter = ['status', 'name']
+    ordering = ['-id']
+    readonly_fields = [field.name for field in models.Job._meta.fields]
+    actions = ['retry_selected']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(permissions=['change'], description=_('Retry selected jobs now'))
+    def retry_selected(self, request, queryset):
+        """Queue failed, or stuck running, jobs again."""
+        count = retry_jobs(queryset)
+        self.message_user(
+            request,
+            _('Queued %(count)d jobs again.') % {'count': count},
+            messages.SUCCESS,
+        )
 
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
+admin.site.register(models.Job, JobAdmin)
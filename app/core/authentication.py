@@ -0,0 +1,75 @@
+"""
+Token authentication that copes with lagging read replicas.
+
+Safe requests read from the replicas, see core.middleware, so a token
+created a moment ago may not be there yet. Both classes fall back to the
+primary when the token is not found.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# Only what the API reads from request.user, everything else (password hash,
+# is_superuser, groups and permissions) is loaded lazily if ever touched.
+CACHED_USER_FIELDS = ['id', 'email', 'name', 'is_active']
+
+
+def user_cache_key(token_key):
+    """Return the cache key holding the user for an auth token."""
+    return f'auth:token:{token_key}'
+
+
+def invalidate_cached_user(user):
+    """Drop the cached user for every token the user has."""
+    keys = Token.objects.filter(user=user).values_list('key', flat=True)
+    cache.delete_many([user_cache_key(key) for key in keys])
+
+
+class PrimaryFallbackTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that looks a missing token up on the primary."""
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        tokens = model.objects.select_related('user')
+        try:
+            token = tokens.get(key=key)
+        except model.DoesNotExist:
+            #a token created a moment ago may not have reached the replicas
+            try:
+                token = tokens.using(router.db_for_write(model)).get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that caches the user and skips the token row."""
+
+    def authenticate_credentials(self, key):
+        cache_key = user_cache_key(key)
+        user = cache.get(cache_key)
+        if user is None:
+            #a token created a moment ago may not have reached the replicas
+            User = get_user_model()
+            user = User.objects.using(router.db_for_write(User)).only(*CACHED_USER_FIELDS).filter(
+                auth_token__key=key
+            ).first()
+            if user is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            cache.set(cache_key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,268 @@
+"""
+Benchmark scenarios for the `benchmark` management command.
+
+Each scenario seeds synthetic data for a throwaway user and returns a dict
+of measurements. The command runs every scenario inside a transaction that
+is rolled back, so nothing is left behind in the database.
+"""
+
+import time
+from decimal import Decimal
+
+from django.contrib.auth import authenticate, get_user_model
+from django.db import connection
+
+from rest_framework.test import APIRequestFactory
+
+from core.models import (
+    CatalogIngredient, Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag,
+    catalog_key,
+)
+from core.similarity import (
+    build_index, get_index, record_change, similar_from_links, similar_recipes,
+)
+from core.throttling import UserTokenBucketThrottle
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark scenario under a name."""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def timed(func, repeat):
+    """Run func repeat times and return the best wall time in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def create_bench_user(email='benchmark@example.com'):
+    """Create the throwaway user that owns the synthetic data."""
+    return get_user_model().objects.create_user(email, 'benchpass123')
+
+
+def seed_recipes(user, count, batch_size=10000):
+    """Bulk insert count recipes for user and return their ids."""
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=5 + i % 120,
+                price=Decimal(i % 5000) / 100,
+            ) for i in range(count)
+        ),
+        batch_size=batch_size,
+    )
+    return list(Recipe.objects.filter(user=user).values_list('id', flat=True))
+
+
+@scenario('assigned_only')
+def bench_assigned_only(rows, repeat):
+    """Compare the old join + DISTINCT assigned_only filter with EXISTS."""
+    rows = rows or 1000000
+    user = create_bench_user()
+    tags_per_recipe = 10
+    tags = Tag.objects.bulk_create(
+        Tag(user=user, name=f'Tag {i}') for i in range(1000)
+    )
+    recipe_ids = seed_recipes(user, max(rows // tags_per_recipe, 1))
+    through = Recipe.tags.through
+    through.objects.bulk_create(
+        (
+            through(recipe_id=recipe_id, tag_id=tags[(n + i) % len(tags)].id)
+            for n, recipe_id in enumerate(recipe_ids)
+            for i in range(tags_per_recipe)
+        ),
+        batch_size=10000,
+    )
+
+    base = Tag.objects.filter(user=user).order_by('-name')
+    return {
+        'through_rows': through.objects.filter(recipe__user=user).count(),
+        'join_distinct_ms': timed(
+            lambda: list(base.filter(recipe__isnull=False).distinct()), repeat
+        ),
+        'exists_ms': timed(lambda: list(base.assigned()), repeat),
+    }
+
+
+@scenario('similar')
+def bench_similar(rows, repeat):
+    """Measure building a similarity index and looking up similar recipes."""
+    rows = rows or 50000
+    user = create_bench_user()
+    tags = Tag.objects.bulk_create(Tag(user=user, name=f'Tag {i}') for i in range(500))
+    recipe_ids = seed_recipes(user, rows)
+    RecipeTag.objects.bulk_create(
+        (
+            RecipeTag(recipe_id=recipe_id, tag_id=tags[(n * 7 + i * 31) % len(tags)].id)
+            for n, recipe_id in enumerate(recipe_ids)
+            for i in range(8)
+        ),
+        batch_size=10000,
+        ignore_conflicts=True,
+    )
+    connection.cursor().execute('ANALYZE')
+    recipe = Recipe.objects.get(pk=recipe_ids[len(recipe_ids) // 2])
+    index = get_index(user.id)
+
+    return {
+        'recipes': rows,
+        'build_ms': timed(lambda: build_index(user.id), repeat), #in the background
+        'lookup_ms': timed(lambda: index.similar(recipe.pk), repeat),
+        'similar_ms': timed(lambda: similar_recipes(recipe), repeat), #includes loading the recipes
+        #the first lookup after a change applies it to the index
+        'similar_after_change_ms': timed(
+            lambda: (record_change(user.id, [recipe.pk]), similar_recipes(recipe)), repeat
+        ),
+        #a process without the index scores against the through tables
+        'similar_without_index_ms': timed(lambda: similar_from_links(recipe), repeat),
+    }
+
+
+@scenario('pantry')
+def bench_pantry(rows, repeat):
+    """Measure ranking recipes by pantry coverage for growing pantries."""
+    rows = rows or 100000
+    user = create_bench_user()
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'Ingredient {i}') for i in range(2000)
+    )
+    recipe_ids = seed_recipes(user, rows)
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredients[(n * 13 + i * 97) % len(ingredients)].id,
+            )
+            for n, recipe_id in enumerate(recipe_ids)
+            for i in range(8)
+        ),
+        batch_size=10000,
+        ignore_conflicts=True,
+    )
+    connection.cursor().execute('ANALYZE')
+
+    results = {'recipes': rows}
+    for size in (10, 100, 1000):
+        pantry = [ingredient.id for ingredient in ingredients[:size]]
+        ranked = Recipe.objects.filter(user=user).rank_by_pantry(pantry).order_by(
+            'missing_ingredients', '-coverage', '-id'
+        )
+        results[f'pantry_{size}_ms'] = timed(lambda: list(ranked[:20]), repeat)
+    return results
+
+
+@scenario('login')
+def bench_login(rows, repeat):
+    """Measure logins per second on one core with the configured hasher."""
+    logins = rows or 50
+    user = create_bench_user()
+    email = user.email
+    elapsed = timed(
+        lambda: [
+            authenticate(username=email, password='benchpass123')
+            for _ in range(logins)
+        ],
+        repeat,
+    )
+    return {
+        'hasher': user.password.split('$', 1)[0],
+        'logins': logins,
+        'login_ms': elapsed / logins,
+        'logins_per_sec': logins / (elapsed / 1000),
+    }
+
+
+@scenario('throttle')
+def bench_throttle(rows, repeat):
+    """Measure the cost of one token bucket throttle check."""
+    checks = rows or 10000
+    request = APIRequestFactory().get('/')
+    request.user = create_bench_user()
+    throttle = UserTokenBucketThrottle()
+    throttle.num_requests = checks * repeat + 1 #never run out of tokens
+    elapsed = timed(
+        lambda: [throttle.allow_request(request, None) for _ in range(checks)],
+        repeat,
+    )
+    return {
+        'checks': checks,
+        'check_us': elapsed * 1000 / checks,
+    }
+
+
+def table_size(model):
+    """Return the on-disk size of a model's table and indexes in bytes."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_total_relation_size(%s)', [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def row_bytes(model):
+    """Return the bytes taken by a model's live rows, without dead tuples."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(SUM(pg_column_size(t.*)), 0) FROM {table} t')
+        return cursor.fetchone()[0]
+
+
+@scenario('catalog')
+def bench_catalog(rows, repeat):
+    """Measure ingredient storage and lookups before and after the catalog.
+
+    The rows are first inserted unlinked with their own spelling, as before
+    the catalog existed, then linked the way migrations 0010 and 0016 do.
+    One user in ten types the names in lower case and keeps a spelling.
+    """
+    users = rows or 1000
+    names = [f'Ingredient {i}' for i in range(200)]
+    for n in range(users):
+        user = create_bench_user(f'benchmark{n}@example.com')
+        #the queryset's bulk_create skips IngredientManager's catalog linking
+        Ingredient.objects.get_queryset().bulk_create(
+            Ingredient(user=user, spelling=name.lower() if n % 10 == 0 else name)
+            for name in names
+        )
+        recipe = Recipe.objects.create(
+            user=user, title='Recipe', time_minutes=5, price=Decimal('1.00')
+        )
+        recipe.ingredients.add(*Ingredient.objects.filter(user=user)[:10])
+    connection.cursor().execute('ANALYZE')
+    before = {
+        'ingredient_row_bytes_before': row_bytes(Ingredient),
+        'by_name_ms': timed(
+            lambda: list(Recipe.objects.filter(ingredients__spelling__iexact=names[0])),
+            repeat,
+        ),
+    }
+
+    entries = CatalogIngredient.objects.intern_many(names)
+    for name in names:
+        catalog_id, _ = entries[catalog_key(name)]
+        Ingredient.objects.filter(spelling=name).update(catalog_id=catalog_id, spelling=None)
+        Ingredient.objects.filter(spelling=name.lower()).update(catalog_id=catalog_id)
+    connection.cursor().execute('ANALYZE')
+    shared = CatalogIngredient.objects.get(key=catalog_key(names[0]))
+
+    return {
+        'ingredients': Ingredient.objects.count(),
+        'catalog_entries': CatalogIngredient.objects.count(),
+        **before,
+        'ingredient_row_bytes_after': row_bytes(Ingredient),
+        'catalog_table_bytes': table_size(CatalogIngredient),
+        'by_catalog_ms': timed(
+            lambda: list(Recipe.objects.filter(ingredients__catalog=shared)),
+            repeat,
+        ),
+    }
@@ -0,0 +1,130 @@
+"""
+Django cache backend on top of the uwsgi shared memory cache.
+
+Every uwsgi worker on a host sees the same cache, so counters such as
+throttle buckets are shared without a network round trip. Outside uwsgi
+(tests, management commands) it falls back to a process local cache.
+"""
+
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+#Django builds a cache instance per thread, the lock must be shared by all
+_fallback_lock = threading.Lock()
+
+
+class UWSGICache(BaseCache):
+    """Cache backend storing pickled values in a uwsgi --cache2 cache."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._cache_name = location or 'default'
+        self._fallback = None
+        if uwsgi is None:
+            self._fallback = LocMemCache(self._cache_name, params)
+
+    @contextmanager
+    def lock(self):
+        """Hold the cache lock for a read-modify-write across calls.
+
+        Under uwsgi this is the global user lock shared by every worker,
+        keep the locked block to a few cache operations.
+        """
+        if self._fallback:
+            with _fallback_lock:
+                yield
+            return
+        uwsgi.lock()
+        try:
+            yield
+        finally:
+            uwsgi.unlock()
+
+    def _expiry(self, timeout):
+        """Return the timeout in whole seconds, 0 meaning no expiry."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return 0
+        return max(int(timeout), 1)
+
+    def _load(self, key):
+        raw = uwsgi.cache_get(key, self._cache_name)
+        if raw is None:
+            return None
+        expires_at, value = pickle.loads(raw)
+        if expires_at and expires_at < time.time():
+            return None
+        return (value,) #wrapped so a cached None is told apart from a miss
+
+    def _store(self, key, value, timeout):
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None and timeout <= 0:
+            uwsgi.cache_del(key, self._cache_name) #same as Django's backends: expire at once
+            return False
+        expiry = self._expiry(timeout)
+        expires_at = time.time() + expiry if expiry else 0
+        raw = pickle.dumps((expires_at, value), pickle.HIGHEST_PROTOCOL)
+        return bool(uwsgi.cache_update(key, raw, expiry, self._cache_name))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._fallback:
+            return self._fallback.add(key, value, timeout, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if self._load(key) is not None:
+            return False
+        return self._store(key, value, timeout)
+
+    def get(self, key, default=None, version=None):
+        if self._fallback:
+            return self._fallback.get(key, default, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._load(key)
+        return default if found is None else found[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._fallback:
+            return self._fallback.set(key, value, timeout, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._store(key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._fallback:
+            return self._fallback.touch(key, timeout, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._load(key)
+        if found is None:
+            return False
+        return self._store(key, found[0], timeout)
+
+    def delete(self, key, version=None):
+        if self._fallback:
+            return self._fallback.delete(key, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(uwsgi.cache_del(key, self._cache_name))
+
+    def has_key(self, key, version=None):
+        if self._fallback:
+            return self._fallback.has_key(key, version)
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._load(key) is not None
+
+    def clear(self):
+        if self._fallback:
+            return self._fallback.clear()
+        uwsgi.cache_clear(self._cache_name)
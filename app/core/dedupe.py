@@ -0,0 +1,86 @@
+"""
+Duplicate detection for tag and ingredient names.
+
+Names are reduced to a match key (case folded, whitespace collapsed, plural
+endings from a short curated list removed) so "Tomato", "tomato " and
+"Tomatoes" share a key. Only names with equal keys are duplicates by
+default: similar looking keys are often different things ("Pea" and
+"Pear"), so typo matching is opt-in through a threshold and skips short
+keys, where one letter is a different word. It compares each sorted key
+with the next few keys only (sorted neighborhood) instead of every pair.
+"""
+
+from difflib import SequenceMatcher
+
+from core.models import normalize_attr_name
+
+#(plural ending, singular ending), first match wins
+PLURAL_ENDINGS = [
+    ('ies', 'y'), #cherries
+    ('oes', 'o'), #tomatoes, potatoes
+    ('ches', 'ch'), #peaches
+    ('shes', 'sh'), #radishes
+    ('xes', 'x'), #boxes
+    ('s', ''), #beans, peas
+]
+#endings that look plural but are not: swiss, hummus, asparagus
+SINGULAR_ENDINGS = ('ss', 'us', 'is')
+MIN_FUZZY_LENGTH = 6 #shorter keys only match exactly
+
+
+def singular(word):
+    """Return the singular of an English plural, other words unchanged."""
+    if len(word) <= 3 or word.endswith(SINGULAR_ENDINGS):
+        return word
+    for plural, replacement in PLURAL_ENDINGS:
+        if word.endswith(plural):
+            return word[:-len(plural)] + replacement
+    return word
+
+
+def match_key(name):
+    """Return the key duplicate names share."""
+    key = normalize_attr_name(name).casefold()
+    return ' '.join(singular(word) for word in key.split(' '))
+
+
+def find_duplicate_groups(items, window=5, threshold=None):
+    """Group (id, name, recipe_count) items of one user that look alike.
+
+    Items match on equal match keys, and also on keys at least threshold
+    similar when one is given. Returns lists of ids with the id to keep
+    first: the most used item, the oldest one on ties. Items without
+    duplicates are left out.
+    """
+    blocks = {}
+    for item in items:
+        blocks.setdefault(match_key(item[1]), []).append(item)
+
+    parent = {key: key for key in blocks}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    keys = [] if threshold is None else sorted(
+        key for key in blocks if len(key) >= MIN_FUZZY_LENGTH
+    )
+    for i, key in enumerate(keys):
+        for other in keys[i + 1:i + 1 + window]:
+            if other[:1] != key[:1]:
+                break #sorted, so nothing further shares the first letter
+            if SequenceMatcher(None, key, other).ratio() >= threshold:
+                parent[find(other)] = find(key)
+
+    clusters = {}
+    for key, block in blocks.items():
+        clusters.setdefault(find(key), []).extend(block)
+
+    groups = []
+    for cluster in clusters.values():
+        if len(cluster) > 1:
+            cluster.sort(key=lambda item: (-item[2], item[0]))
+            groups.append([item[0] for item in cluster])
+    return groups
@@ -0,0 +1,133 @@
+"""
+Set based deletion of recipes and users.
+
+Model.delete() and QuerySet.delete() collect every related row in Python
+and send the delete signals one object at a time, which for a user with
+100k recipes loads the whole graph into memory. These helpers delete the
+through rows and then the rows themselves with DELETE ... WHERE id IN
+(...) statements, one chunk per transaction, so time grows linearly and
+memory stays bounded by the chunk size.
+"""
+import time
+
+from django.conf import settings
+from django.db import router, transaction
+
+from core.authentication import invalidate_cached_user
+from core.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag,
+)
+from core.sharding import shard_for_user, use_shard
+from core.similarity import record_recipes_on_commit
+
+CHUNK_SIZE = 1000
+
+
+def _raw_delete(queryset):
+    """DELETE the queryset's rows without collecting them or sending signals."""
+    queryset._for_write = True #route like QuerySet.delete() does
+    return queryset._raw_delete(queryset.db)
+
+
+def delete_recipes(ids, chunk_size=CHUNK_SIZE, recount=True, on_chunk=None):
+    """Delete recipes by id, return how many were deleted.
+
+    Tags and ingredients the recipes used are recounted once per chunk.
+    on_chunk(deleted so far) is called after each chunk commits.
+    """
+    ids = list(ids)
+    deleted = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        db = router.db_for_write(Recipe)
+        with transaction.atomic(using=db):
+            #no signals are sent
+            record_recipes_on_commit(Recipe.all_objects.filter(pk__in=chunk), using=db)
+            tag_rows = RecipeTag.objects.filter(recipe_id__in=chunk)
+            ingredient_rows = RecipeIngredient.objects.filter(recipe_id__in=chunk)
+            if recount:
+                tag_ids = set(tag_rows.values_list('tag_id', flat=True))
+                ingredient_ids = set(ingredient_rows.values_list('ingredient_id', flat=True))
+            _raw_delete(tag_rows)
+            _raw_delete(ingredient_rows)
+            deleted += _raw_delete(Recipe.all_objects.filter(pk__in=chunk))
+            if recount:
+                Tag.objects.refresh_recipe_counts(tag_ids)
+                Ingredient.objects.refresh_recipe_counts(ingredient_ids)
+        if on_chunk is not None:
+            on_chunk(deleted)
+    return deleted
+
+
+def _first_ids(queryset, chunk_size):
+    """Return the next chunk of primary keys left in queryset."""
+    return list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+
+
+def delete_user_data(user, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Delete a user's recipes, tags and ingredients in chunks."""
+    deleted = 0
+    with use_shard(shard_for_user(user.pk)):
+        while True:
+            ids = _first_ids(Recipe.all_objects.filter(user=user), chunk_size)
+            if not ids:
+                break
+            #the user's tags and ingredients go next, no need to recount them
+            deleted += delete_recipes(ids, chunk_size, recount=False)
+            if on_chunk is not None:
+                on_chunk(deleted)
+
+        for model, rows, attr_field in [
+            (Tag, RecipeTag.objects, 'tag_id'),
+            (Ingredient, RecipeIngredient.objects, 'ingredient_id'),
+        ]:
+            while True:
+                ids = _first_ids(model.objects.filter(user=user), chunk_size)
+                if not ids:
+                    break
+                with transaction.atomic(using=router.db_for_write(model)):
+                    #links from recipes reassigned to another user
+                    _raw_delete(rows.filter(**{f'{attr_field}__in': ids}))
+                    deleted += _raw_delete(model.objects.filter(pk__in=ids))
+    return deleted
+
+
+def delete_user(user, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Delete a user, removing their recipe data set based first."""
+    delete_user_data(user, chunk_size, on_chunk)
+    invalidate_cached_user(user) #their tokens must stop working right away
+    user.delete()
+
+
+def purge_deleted_recipes(older_than, batch_size=200, pause=0, on_batch=None):
+    """Hard delete recipes soft deleted before older_than, on every shard.
+
+    Works in small batches with a pause in between so it can run next to
+    live traffic, and removes the image files once a batch has committed.
+    """
+    purged = 0
+    for alias in settings.DATABASE_SHARDS:
+        with use_shard(alias):
+            while True:
+                batch = list(
+                    Recipe.all_objects.filter(deleted_at__lt=older_than).order_by(
+                        'deleted_at'
+                    ).only('pk', 'image')[:batch_size]
+                )
+                if not batch:
+                    break
+                #soft_delete already took them out of recipe_count
+                purged += delete_recipes([recipe.pk for recipe in batch], batch_size, recount=False)
+                images = {recipe.image.name: recipe.image for recipe in batch if recipe.image}
+                #duplicated recipes share the image file of the original
+                still_used = set(
+                    Recipe.all_objects.filter(image__in=images).values_list('image', flat=True)
+                )
+                for name, image in images.items():
+                    if name not in still_used:
+                        image.storage.delete(name)
+                if on_batch is not None:
+                    on_batch(purged)
+                time.sleep(pause)
+    return purged
+
@@ -0,0 +1,110 @@
+"""
+Password hashers with cost parameters taken from settings.
+
+Changing a cost setting makes Django's check_password() rehash the stored
+password with the new parameters the next time the user logs in.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+)
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with the iteration count from PASSWORD_PBKDF2_ITERATIONS."""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2 with the costs from PASSWORD_ARGON2_*."""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class HashingBusy(Exception):
+    """Raised when no password hashing slot frees up in time."""
+
+
+# uwsgi runs single threaded workers, so a per-process limit bounds
+# nothing. The slots are keys in the uwsgi cache shared by every worker on
+# the host: with PASSWORD_HASH_CONCURRENCY below the worker count, logins
+# can never occupy every worker and other requests keep being served.
+SLOT_TIMEOUT = 60 #seconds until the slot of a killed worker frees up
+SLOT_POLL_INTERVAL = 0.01
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _get_slots():
+    """Create the semaphore used outside uwsgi on first use."""
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_CONCURRENCY)
+    return _slots
+
+
+def _cache_name():
+    return settings.CACHES['default'].get('LOCATION') or 'default'
+
+
+def _take_host_slot():
+    """Claim a free host wide slot and return its key, or None."""
+    for index in range(settings.PASSWORD_HASH_CONCURRENCY):
+        key = f'password-hash-slot:{index}'
+        #cache_set only stores the key when it does not exist yet
+        if uwsgi.cache_set(key, str(os.getpid()), SLOT_TIMEOUT, _cache_name()):
+            return key
+    return None
+
+
+@contextmanager
+def hashing_slot():
+    """Bound how many logins hash passwords at once on this host."""
+    if uwsgi is None: #tests and management commands, one process
+        slots = _get_slots()
+        if not slots.acquire(timeout=settings.PASSWORD_HASH_WAIT):
+            raise HashingBusy
+        try:
+            yield
+        finally:
+            slots.release()
+        return
+
+    deadline = time.monotonic() + settings.PASSWORD_HASH_WAIT
+    key = _take_host_slot()
+    while key is None:
+        if time.monotonic() >= deadline:
+            raise HashingBusy
+        time.sleep(SLOT_POLL_INTERVAL)
+        key = _take_host_slot()
+    try:
+        yield
+    finally:
+        uwsgi.cache_del(key, _cache_name())
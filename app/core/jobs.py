@@ -0,0 +1,324 @@
+"""
+Background jobs run outside the request by the run_worker command.
+
+A job is a function registered with @job that receives the Job row and the
+payload it was enqueued with. Long jobs work in chunks, each in its own
+transaction, and report progress with job.progress/job.total.
+
+The queue is the Job table itself, workers claim rows with SELECT ... FOR
+UPDATE SKIP LOCKED so any number of them can poll it at once. A job that
+raises is queued again with exponential backoff until it has used up
+max_attempts, so jobs should be safe to run more than once.
+
+A claimed job holds a lease of JOB_LEASE_SECONDS, renewed every time it
+reports progress. When a worker is killed mid-job its lease runs out and
+the next claim queues the job again, or fails it once its attempts are
+used up. Jobs must report progress more often than the lease lasts.
+
+Jobs on recipe data take the shard the rows live on, the admin passes the
+shard its changelist read them from. Rows picked in the admin are passed as
+their ids, or for "select all" as the changelist's filters, which the job
+pages through, see selected_chunks.
+"""
+
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import F
+from django.http import HttpRequest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.deletion import delete_recipes, delete_user, purge_deleted_recipes
+from core.models import Job, Recipe, Tag, Ingredient, User
+from core.sharding import shard_for_user, use_shard
+from core.similarity import record_change_on_commit, record_recipes_on_commit
+
+JOBS = {}
+
+
+def job(name):
+    """Register a function as a background job."""
+    def decorator(func):
+        JOBS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, **payload):
+    """Queue a job to run in the worker and return its row."""
+    if name not in JOBS:
+        raise ValueError(f'Unknown job {name}')
+    return Job.objects.create(name=name, payload=payload)
+
+
+def lease_until(now):
+    """Return when a lease taken or renewed at now runs out."""
+    return now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+def expire_leases(now):
+    """Queue again, or fail, running jobs whose lease ran out."""
+    lost = Job.objects.filter(status=Job.RUNNING, lease_expires_at__lt=now)
+    error = 'The lease expired, the worker running the job was lost.'
+    lost.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED, run_after=now, lease_expires_at=None, error=error
+    )
+    lost.update(
+        status=Job.FAILED, finished_at=now, lease_expires_at=None, error=error
+    )
+
+
+def claim_next_job():
+    """Mark the oldest due job as running and return it, or None."""
+    now = timezone.now()
+    expire_leases(now)
+    with transaction.atomic():
+        #rows other workers are claiming are skipped instead of waited on
+        job_obj = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_after__lte=now
+        ).order_by('id').first()
+        if job_obj is None:
+            return None
+        job_obj.status = Job.RUNNING
+        job_obj.attempts += 1
+        job_obj.started_at = now
+        job_obj.lease_expires_at = lease_until(now)
+        job_obj.save(update_fields=['status', 'attempts', 'started_at', 'lease_expires_at'])
+    return job_obj
+
+
+def retry_delay(attempts):
+    """Return how long to wait before the next attempt, doubling each time."""
+    seconds = settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.JOB_RETRY_MAX_DELAY))
+
+
+def run_job(job_obj):
+    """Run a claimed job and record how it ended, queueing it again on errors.
+
+    Nothing is recorded when the lease was lost meanwhile, the job then
+    belongs to whichever worker claimed it next.
+    """
+    fields = ['status', 'error', 'finished_at', 'lease_expires_at']
+    try:
+        JOBS[job_obj.name](job_obj, **job_obj.payload)
+    except Exception:
+        job_obj.error = traceback.format_exc()
+        if job_obj.attempts < job_obj.max_attempts:
+            job_obj.status = Job.QUEUED
+            job_obj.run_after = timezone.now() + retry_delay(job_obj.attempts)
+            fields.append('run_after')
+        else:
+            job_obj.status = Job.FAILED
+    else:
+        job_obj.status = Job.DONE
+    job_obj.finished_at = timezone.now()
+    job_obj.lease_expires_at = None
+    Job.objects.filter(
+        pk=job_obj.pk, status=Job.RUNNING, started_at=job_obj.started_at
+    ).update(**{field: getattr(job_obj, field) for field in fields})
+
+
+def retry_jobs(queryset):
+    """Queue jobs again right away with a fresh set of attempts."""
+    return queryset.exclude(status=Job.QUEUED).update(
+        status=Job.QUEUED,
+        attempts=0,
+        run_after=timezone.now(),
+        error='',
+        finished_at=None,
+        lease_expires_at=None,
+    )
+
+
+def report_progress(job_obj, done, total=None):
+    """Store how far a job got, visible in the admin while it runs.
+
+    Also renews the job's lease.
+    """
+    job_obj.progress = done
+    job_obj.lease_expires_at = lease_until(timezone.now())
+    fields = ['progress', 'lease_expires_at']
+    if total is not None:
+        job_obj.total = total
+        fields.append('total')
+    Job.objects.filter(pk=job_obj.pk).update(
+        **{field: getattr(job_obj, field) for field in fields}
+    )
+
+
+def chunks(ids, size):
+    """Split a list of ids into lists of at most size ids."""
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def id_chunks(queryset, size):
+    """Yield the primary keys of queryset in lists of at most size, by pk.
+
+    Each list is read once the previous one was handled, so the rows
+    already yielded may be changed or deleted meanwhile.
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last_id = None
+    while True:
+        page = pks if last_id is None else pks.filter(pk__gt=last_id)
+        ids = list(page[:size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def changelist_queryset(model, params, user_id, max_id):
+    """Return the rows an admin changelist lists for params, as user_id saw them.
+
+    Rows newer than max_id, added after the job was queued, are left out.
+    """
+    request = HttpRequest()
+    request.GET.update(params)
+    request.user = User.objects.get(pk=user_id)
+    changelist = admin.site._registry[model].get_changelist_instance(request)
+    return changelist.queryset.filter(pk__lte=max_id)
+
+
+def selected_chunks(model, ids=None, changelist=None, chunk_size=500):
+    """Return how many rows a job was queued for and their ids in chunks.
+
+    ids are rows picked one by one, changelist the filters of an admin
+    "select all", see core.admin.selection.
+    """
+    if changelist is None:
+        return len(ids), chunks(ids, chunk_size)
+    queryset = changelist_queryset(model, **changelist)
+    return queryset.count(), id_chunks(queryset, chunk_size)
+
+
+@job('delete_objects')
+def delete_objects(job_obj, model, ids=None, changelist=None, chunk_size=500, shard=None):
+    """Delete rows of a model in short transactions."""
+    model = apps.get_model(model)
+    with use_shard(shard):
+        total, id_lists = selected_chunks(model, ids, changelist, chunk_size)
+        report_progress(job_obj, 0, total)
+        done = 0
+        for chunk in id_lists:
+            if model is Recipe:
+                delete_recipes(chunk, chunk_size) #set based, see core.deletion
+            elif model is User:
+                for user in User.objects.filter(pk__in=chunk):
+                    delete_user(user)
+            else:
+                with transaction.atomic(using=router.db_for_write(model)):
+                    model.objects.filter(pk__in=chunk).delete()
+            done += len(chunk)
+            report_progress(job_obj, min(done, total))
+
+
+@job('purge_recipes')
+def purge_recipes(job_obj, older_than, batch_size=200, pause=0.5):
+    """Hard delete recipes soft deleted before older_than (ISO 8601)."""
+    purge_deleted_recipes(
+        parse_datetime(older_than),
+        batch_size,
+        pause,
+        on_batch=lambda purged: report_progress(job_obj, purged),
+    )
+
+
+@job('merge_attrs')
+def merge_attrs(job_obj, model, groups, shard=None):
+    """Merge groups of duplicate tags or ingredients into their first id."""
+    model = apps.get_model(model)
+    report_progress(job_obj, 0, len(groups))
+    with use_shard(shard):
+        for done, (keep_id, *merge_ids) in enumerate(groups, start=1):
+            with transaction.atomic(using=router.db_for_write(model)):
+                merge_into(model, keep_id, merge_ids)
+            report_progress(job_obj, done)
+
+
+def merge_into(model, keep_id, merge_ids):
+    """Point every recipe using merge_ids at keep_id and delete merge_ids."""
+    rows, attr_field = model.objects.all()._through_rows()
+    recipe_ids = set(
+        rows.filter(**{f'{attr_field}__in': merge_ids}).values_list('recipe_id', flat=True)
+    )
+    #no signals are sent for the through rows
+    record_recipes_on_commit(
+        Recipe.all_objects.filter(pk__in=recipe_ids), using=router.db_for_write(model)
+    )
+    recipe_ids -= set(
+        rows.filter(**{attr_field: keep_id}).values_list('recipe_id', flat=True)
+    )
+    rows.bulk_create([
+        rows.model(recipe_id=recipe_id, **{attr_field: keep_id})
+        for recipe_id in recipe_ids
+    ])
+    rows.filter(**{f'{attr_field}__in': merge_ids}).delete()
+    model.objects.filter(pk__in=merge_ids).delete()
+    model.objects.refresh_recipe_counts([keep_id])
+
+
+@job('reassign_recipes')
+def reassign_recipes(job_obj, user_id, ids=None, changelist=None, chunk_size=500, shard=None):
+    """Move recipes to another owner, along with their tags and ingredients."""
+    shard = shard or DEFAULT_DB_ALIAS
+    if shard_for_user(user_id) != shard:
+        raise ValueError(
+            f'User {user_id} is not on {shard}, move them there with move_user first'
+        )
+    with use_shard(shard):
+        total, id_lists = selected_chunks(Recipe, ids, changelist, chunk_size)
+        report_progress(job_obj, 0, total)
+        done = 0
+        for chunk in id_lists:
+            with transaction.atomic(using=shard):
+                recipes = Recipe.objects.filter(pk__in=chunk)
+                #update() sends no signals, both owners' indexes change
+                record_recipes_on_commit(recipes, using=shard)
+                record_change_on_commit(user_id, chunk, using=shard)
+                recipes.update(user_id=user_id)
+                for model in (Tag, Ingredient):
+                    move_attrs(model, chunk, user_id)
+            done += len(chunk)
+            report_progress(job_obj, min(done, total))
+
+
+def move_attrs(model, recipe_ids, user_id):
+    """Repoint the recipes' tags or ingredients at same named ones of user_id."""
+    rows, attr_field = model.objects.all()._through_rows()
+    related = model._meta.model_name
+    links = list(
+        rows.filter(recipe_id__in=recipe_ids).exclude(
+            **{f'{related}__user_id': user_id}
+        ).annotate(
+            attr_name=model.objects.name_expression(f'{related}__')
+        ).values_list('pk', 'recipe_id', attr_field, 'attr_name')
+    )
+    if not links:
+        return
+    names = {name for *_, name in links}
+    targets = dict(
+        model.objects.filter(user_id=user_id, name__in=names).values_list('name', 'pk')
+    )
+    created = model.objects.bulk_create([
+        model(user_id=user_id, name=name) for name in names - set(targets)
+    ])
+    targets.update({obj.name: obj.pk for obj in created})
+
+    rows.filter(pk__in=[pk for pk, *_ in links]).delete()
+    rows.bulk_create(
+        [
+            rows.model(recipe_id=recipe_id, **{attr_field: targets[name]})
+            for _, recipe_id, _, name in links
+        ],
+        ignore_conflicts=True, #two old attrs can map onto the same target
+    )
+    model.objects.refresh_recipe_counts(
+        {old_id for _, _, old_id, _ in links} | set(targets.values())
+    )
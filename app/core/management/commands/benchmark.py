@@ -0,0 +1,48 @@
+"""
+Django command to benchmark query paths against synthetic data.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.benchmarks import SCENARIOS
+
+
+class Rollback(Exception):
+    """Raised to roll back the data seeded by a scenario."""
+
+
+class Command(BaseCommand):
+
+    """Django command to run a benchmark scenario."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', help=', '.join(sorted(SCENARIOS)))
+        parser.add_argument(
+            '--rows', type=int, default=None,
+            help='Size of the synthetic data set, each scenario has a default.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of timed runs, the best one is reported.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        func = SCENARIOS.get(options['scenario'])
+        if func is None:
+            raise CommandError(
+                f"Unknown scenario, choose from: {', '.join(sorted(SCENARIOS))}"
+            )
+
+        self.stdout.write(f"Running {options['scenario']} benchmark...")
+        try:
+            with transaction.atomic():
+                results = func(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.2f}"
+            self.stdout.write(f"{key}: {value}")
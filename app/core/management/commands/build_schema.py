@@ -0,0 +1,44 @@
+"""
+Django command to prebuild the OpenAPI schema served at /api/schema/.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    """Django command to write or verify the rendered OpenAPI schema."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Fail if the schema on disk does not match the code.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        from app.schema import render_schemas, schema_path
+
+        stale = []
+        for fmt, body in render_schemas().items():
+            path = schema_path(fmt)
+            if options['check']:
+                if not os.path.exists(path):
+                    stale.append(f'{path} is missing')
+                    continue
+                with open(path, 'rb') as f:
+                    if f.read() != body:
+                        stale.append(f'{path} is out of date')
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(body)
+                self.stdout.write(f'Wrote {path} ({len(body)} bytes)')
+
+        if stale:
+            raise CommandError(
+                '; '.join(stale) + ', run manage.py build_schema'
+            )
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Schema is up to date'))
@@ -0,0 +1,180 @@
+"""
+Django command to create many users and their auth tokens from a file.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from rest_framework.authtoken.models import Token
+
+
+def read_rows(path, fmt):
+    """Yield (line number, row dict, error) from a CSV or NDJSON file.
+
+    row is None and error says why for lines that can't be parsed.
+    """
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+        else:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_num, None, f'invalid JSON ({e.msg})'
+                    continue
+                if not isinstance(row, dict):
+                    yield line_num, None, 'expected a JSON object'
+                    continue
+                yield line_num, row, None
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items without reading the whole iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def hash_passwords(passwords):
+    """Hash a chunk of passwords, run inside the worker processes."""
+    return [make_password(password or None) for password in passwords]
+
+
+class Command(BaseCommand):
+
+    """Django command to bulk create users."""
+
+    help = 'Create users and auth tokens from a CSV or NDJSON file with email, password and name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Password hashing processes, 0 hashes in this process.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        path = options['path']
+        fmt = options['format'] or (
+            'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+        )
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+
+        pool = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(options['workers'], initializer=django.setup)
+
+        self.created = 0
+        self.failed = 0
+        self.seen = set()
+        start = time.perf_counter()
+        try:
+            for batch in batched(read_rows(path, fmt), options['batch_size']):
+                self.create_batch(batch, pool, options['workers'])
+        finally:
+            if pool:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        rate = self.created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {self.created} users, {self.failed} failed '
+            f'in {elapsed:.1f}s ({rate:.0f} users/s)'
+        ))
+
+    def fail(self, line_num, reason):
+        """Report a row that could not be imported."""
+        self.failed += 1
+        self.stderr.write(f'line {line_num}: {reason}')
+
+    def validate(self, batch):
+        """Return the valid rows of a batch, reporting the others."""
+        rows = []
+        for line_num, row, error in batch:
+            if error:
+                self.fail(line_num, error)
+                continue
+            wrong = [
+                field for field in ('email', 'password', 'name')
+                if not isinstance(row.get(field) or '', str)
+            ]
+            if wrong:
+                self.fail(line_num, f"{', '.join(wrong)} must be text")
+                continue
+            email = get_user_model().objects.normalize_email(
+                (row.get('email') or '').strip()
+            )
+            try:
+                validate_email(email)
+            except ValidationError:
+                self.fail(line_num, f'invalid email {email!r}')
+                continue
+            if email in self.seen:
+                self.fail(line_num, f'duplicate email {email} in file')
+                continue
+            self.seen.add(email)
+            rows.append((line_num, email, row))
+
+        existing = set(
+            get_user_model().objects.filter(
+                email__in=[email for _, email, _ in rows]
+            ).values_list('email', flat=True)
+        )
+        valid = []
+        for line_num, email, row in rows:
+            if email in existing:
+                self.fail(line_num, f'user {email} already exists')
+            else:
+                valid.append((email, row))
+        return valid
+
+    def create_batch(self, batch, pool, workers):
+        """Hash, insert and create tokens for one batch of rows."""
+        valid = self.validate(batch)
+        if not valid:
+            return
+
+        passwords = [row.get('password') for _, row in valid]
+        if pool:
+            chunk = max(len(passwords) // workers, 1)
+            hashed = [
+                hashed
+                for result in pool.map(hash_passwords, list(batched(passwords, chunk)))
+                for hashed in result
+            ]
+        else:
+            hashed = hash_passwords(passwords)
+
+        User = get_user_model()
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=email, name=row.get('name') or '', password=password)
+                for (email, row), password in zip(valid, hashed)
+            ])
+            Token.objects.bulk_create(
+                [Token(key=Token.generate_key(), user=user) for user in users]
+            )
+        self.created += len(users)
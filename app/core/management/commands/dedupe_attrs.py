@@ -0,0 +1,68 @@
+"""
+Django command to merge duplicate tags and ingredients.
+
+Only reports the duplicates unless --apply is given.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.dedupe import find_duplicate_groups
+from core.jobs import merge_into
+from core.models import Tag, Ingredient
+
+MODELS = {'tag': Tag, 'ingredient': Ingredient}
+
+
+class Command(BaseCommand):
+
+    """Django command to deduplicate tags and ingredients per user."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(MODELS), action='append',
+            help='Only deduplicate this model, may be repeated.'
+        )
+        parser.add_argument('--user', type=int, help='Only this user id.')
+        parser.add_argument('--window', type=int, default=5)
+        parser.add_argument(
+            '--threshold', type=float,
+            help='Also match names this similar (0-1), off by default.'
+        )
+        parser.add_argument(
+            '--apply', action='store_true',
+            help='Merge the groups, they are only reported otherwise.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        for name in options['model'] or sorted(MODELS):
+            model = MODELS[name]
+            user_ids = [options['user']] if options['user'] else (
+                model.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+            )
+            merged = 0
+            for user_id in user_ids:
+                merged += self.dedupe_user(model, user_id, options)
+            verb = 'merged' if options['apply'] else 'would merge'
+            self.stdout.write(self.style.SUCCESS(f'{name}: {verb} {merged} rows'))
+
+    def dedupe_user(self, model, user_id, options):
+        """Merge the duplicates of one user, one transaction per user."""
+        items = list(model.objects.filter(user_id=user_id).values_list(
+            'pk', 'name', 'recipe_count'
+        ))
+        groups = find_duplicate_groups(
+            items, window=options['window'], threshold=options['threshold']
+        )
+        names = {pk: name for pk, name, _ in items}
+        merged = 0
+        with transaction.atomic():
+            for keep_id, *merge_ids in groups:
+                self.stdout.write(
+                    f"user {user_id}: {names[keep_id]!r} <- "
+                    f"{', '.join(repr(names[pk]) for pk in merge_ids)}"
+                )
+                if options['apply']:
+                    merge_into(model, keep_id, merge_ids)
+                merged += len(merge_ids)
+        return merged
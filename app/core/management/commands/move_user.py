@@ -0,0 +1,37 @@
+"""
+Django command to move a user's recipe data to another shard.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.models import User
+from core.sharding import move_user_data
+
+
+class Command(BaseCommand):
+
+    """Django command to rebalance shards one user at a time."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int, nargs='+')
+        parser.add_argument('--to', required=True, help='Target shard alias.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        target = options['to']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(
+                f"Unknown shard, choose from: {', '.join(settings.DATABASE_SHARDS)}"
+            )
+
+        for user_id in options['user_id']:
+            user = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).first()
+            if user is None:
+                raise CommandError(f'User {user_id} does not exist')
+            moved = move_user_data(user, target)
+            if moved is None:
+                self.stdout.write(f'User {user_id} is already on {target}')
+                continue
+            summary = ', '.join(f'{count} {name}' for name, count in moved.items())
+            self.stdout.write(self.style.SUCCESS(f'Moved user {user_id} to {target}: {summary}'))
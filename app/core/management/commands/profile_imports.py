@@ -0,0 +1,67 @@
+"""
+Django command to report what importing the project costs per module.
+"""
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(output):
+    """Parse `python -X importtime` output into (module, self us, cumulative us)."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+
+    """Django command to profile import time in a fresh interpreter."""
+
+    help = 'Import a module in a fresh interpreter and report the slowest imports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target', nargs='?', default='app.wsgi',
+            help='Module to import after django.setup(), app.wsgi by default.'
+        )
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument(
+            '--by-package', action='store_true',
+            help='Sum the self time of each top level package.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        code = f"import django; django.setup(); import {options['target']}"
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        rows = parse_importtime(result.stderr)
+        imported = {name for name, _, _ in rows}
+        total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+        if options['by_package']:
+            packages = {}
+            for name, self_us, _ in rows:
+                package = name.split('.', 1)[0]
+                packages[package] = packages.get(package, 0) + self_us
+            rows = [(name, self_us, self_us) for name, self_us in packages.items()]
+
+        self.stdout.write(f"{'self ms':>9} {'cumul ms':>9}  module")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[1])[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} modules, {total_ms:.0f} ms to import {options['target']}"
+        ))
+        if 'drf_spectacular.openapi' in imported:
+            self.stdout.write(self.style.WARNING('drf_spectacular.openapi was imported eagerly'))
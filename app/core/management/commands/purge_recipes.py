@@ -0,0 +1,52 @@
+"""
+Django command to hard delete soft deleted recipes.
+
+Meant to run off-peak, e.g. from cron, or with --background in the worker.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.deletion import purge_deleted_recipes
+from core.jobs import enqueue
+
+
+class Command(BaseCommand):
+
+    """Django command to purge recipes deleted through the API."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=settings.RECIPE_PURGE_AFTER_HOURS,
+            help='Only purge recipes deleted at least this many hours ago.'
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--pause', type=float, default=0.5,
+            help='Seconds to sleep between batches.'
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Queue a purge_recipes job for run_worker instead.'
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        older_than = timezone.now() - timedelta(hours=options['older_than'])
+        if options['background']:
+            job = enqueue(
+                'purge_recipes',
+                older_than=older_than.isoformat(),
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Queued {job}'))
+            return
+
+        purged = purge_deleted_recipes(
+            older_than, options['batch_size'], options['pause'],
+            on_batch=lambda purged: self.stdout.write(f'{purged} purged...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} recipes'))
@@ -0,0 +1,101 @@
+"""
+Django command to run queued background jobs.
+"""
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from core.jobs import claim_next_job, run_job
+
+MAX_BACKOFF = 60 #seconds between attempts while the database is unreachable
+
+
+def close_old_connections():
+    """Close connections broken by a restart or past CONN_MAX_AGE.
+
+    Like django.db.close_old_connections, but leaves a connection alone
+    inside a transaction the worker was called in.
+    """
+    for conn in connections.all():
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+class Command(BaseCommand):
+
+    """Django command to process the job queue."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due instead of polling.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to sleep when the queue is empty.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Jobs to run at the same time, each in its own thread.'
+        )
+
+    def work(self, options, stop):
+        """Claim and run jobs until stopped, or the queue is empty with --once."""
+        failures = 0
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job()
+                if job is not None:
+                    self.stdout.write(f'Running {job} (attempt {job.attempts})...')
+                    run_job(job)
+                    self.stdout.write(f'{job} {job.status}')
+            except DatabaseError as e:
+                #a job left running is picked up again when its lease expires
+                failures += 1
+                delay = min(options['poll_interval'] * 2 ** failures, MAX_BACKOFF)
+                self.stderr.write(f'Database error, retrying in {delay:.0f}s: {e}')
+                stop.wait(delay)
+                continue
+            failures = 0
+            if job is None:
+                if options['once']:
+                    break
+                stop.wait(options['poll_interval'])
+
+    def work_in_thread(self, options, stop):
+        try:
+            self.work(options, stop)
+        finally:
+            connections.close_all() #each thread has its own connections
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping after the running jobs finish...')
+            stop.set()
+
+        previous = {
+            signum: signal.signal(signum, shutdown)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        self.stdout.write(f"Worker started with {options['concurrency']} thread(s)")
+        try:
+            if options['concurrency'] <= 1:
+                self.work(options, stop)
+            else:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    futures = [
+                        pool.submit(self.work_in_thread, options, stop)
+                        for _ in range(options['concurrency'])
+                    ]
+                    for future in futures:
+                        future.result()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
@@ -1,27 +1,115 @@
 """
 Django command to wait for the database to be available.
 """
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+
+class NotReady(Exception):
+    """Raised by a readiness check that should be retried."""
 
 
 class Command(BaseCommand):
 
     """Django command to wait for database."""
 
+    # Only a connection is needed, running the system checks on every
+    # start made container startup slow.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Database alias to wait for, may be repeated. Defaults to all of them.'
+        )
+        parser.add_argument(
+            '--migrations', action='store_true',
+            help='Also wait until every migration has been applied.'
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Touch every model table and the cache once the database is up.'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=None,
+            help='Give up after this many seconds, waits forever by default.'
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.05)
+        parser.add_argument('--max-delay', type=float, default=2.0)
+
+    def check_database(self, alias, migrations=False):
+        """Raise unless the database accepts queries (and is migrated)."""
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if migrations:
+            executor = MigrationExecutor(connection)
+            plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+            if plan:
+                raise NotReady(f'{len(plan)} unapplied migrations')
+
+    def warm(self, alias):
+        """Load the server side catalog for every table and touch the cache."""
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            existing = set(connection.introspection.table_names(cursor))
+            for model in apps.get_models():
+                if model._meta.db_table in existing:
+                    table = connection.ops.quote_name(model._meta.db_table)
+                    cursor.execute(f'SELECT 1 FROM {table} LIMIT 1')
+        caches['default'].get('wait_for_db')
+
+    def wait_for(self, alias, options):
+        """Retry check_database with exponential backoff and full jitter."""
+        start = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    self.check_database(alias, options['migrations'])
+                    break
+                except (Psycopg2OpError, OperationalError, NotReady) as e:
+                    elapsed = time.monotonic() - start
+                    if options['timeout'] is not None and elapsed >= options['timeout']:
+                        raise CommandError(
+                            f'Database {alias} not ready after {elapsed:.1f}s: {e}'
+                        )
+                    delay = min(
+                        options['max_delay'],
+                        options['initial_delay'] * 2 ** (attempt - 1),
+                    )
+                    self.stdout.write(f'Database {alias} unavailable ({e}), retrying...')
+                    time.sleep(random.uniform(0, delay))
+            if options['warm']:
+                self.warm(alias)
+        finally:
+            #each thread has its own connection, don't leave them open
+            connections[alias].close()
+        return attempt, time.monotonic() - start
+
     def handle(self, *args, **options):
         """Entry point for command"""
+        aliases = options['databases'] or list(settings.DATABASES)
         self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2OpError, OperationalError):
-                self.stdout.write("Database unavailable, waiting 1 second...")
-                time.sleep(1)
+        with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+            futures = {
+                alias: pool.submit(self.wait_for, alias, options) for alias in aliases
+            }
+            for alias, future in futures.items():
+                attempts, elapsed = future.result()
+                self.stdout.write(
+                    f'{alias} ready in {elapsed * 1000:.0f} ms after {attempts} attempt(s)'
+                )
 
         self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,51 @@
+"""
+Middleware for the core app.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.routers import read_from_replicas
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def sticky_cache_key(request):
+    """Return the cache key pinning a client to the primary, if identifiable.
+
+    Clients are told apart by their auth token or session cookie, which are
+    known before authentication runs in the view.
+    """
+    credential = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credential:
+        return None
+    return 'db:sticky:' + hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+class ReplicaRoutingMiddleware:
+    """Serve safe requests from the replicas with read-your-writes.
+
+    After a client sends a write its requests read from the primary for
+    DATABASE_REPLICA_STICKY_SECONDS, long enough for the replicas to catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        key = sticky_cache_key(request)
+        safe = request.method in SAFE_METHODS
+        use_replicas = safe and not (key and cache.get(key))
+        with read_from_replicas(use_replicas):
+            response = self.get_response(request)
+
+        if not safe and key:
+            cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.23 on 2026-10-19 09:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def backfill_recipe_counts(apps, schema_editor):
+    """Populate recipe_count from the existing through rows."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for field, attr_field in (('tags', 'tag_id'), ('ingredients', 'ingredient_id')):
+        through = getattr(Recipe, field).through
+        model = getattr(Recipe, field).field.related_model
+        counts = through.objects.filter(
+            **{attr_field: models.OuterRef('pk')}
+        ).order_by().values(attr_field).annotate(
+            count=models.Count('pk')
+        ).values('count')
+        model.objects.update(
+            recipe_count=django.db.models.functions.Coalesce(
+                models.Subquery(counts), 0
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(models.F('user'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='text_pattern_ops'), name='core_ingredient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(models.F('user'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='text_pattern_ops'), name='core_tag_user_name_idx'),
+        ),
+        migrations.RunPython(backfill_recipe_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.23 on 2026-10-19 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 5000
+
+
+def backfill_catalog(apps, schema_editor):
+    """Link existing ingredients to catalog entries, one id range at a time."""
+    Ingredient = apps.get_model('core', 'Ingredient')
+    CatalogIngredient = apps.get_model('core', 'CatalogIngredient')
+    db = schema_editor.connection.alias #the shard being migrated, not the router's pick
+    last_id = 0
+    while True:
+        batch = list(
+            Ingredient.objects.using(db).filter(id__gt=last_id).order_by('id').only('id', 'name')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        keys = {ing.id: ' '.join(ing.name.split()).casefold() for ing in batch}
+        CatalogIngredient.objects.using(db).bulk_create(
+            [CatalogIngredient(name=key) for key in set(keys.values())],
+            ignore_conflicts=True,
+        )
+        ids = dict(
+            CatalogIngredient.objects.using(db).filter(name__in=set(keys.values())).values_list('name', 'id')
+        )
+        for ing in batch:
+            ing.catalog_id = ids[keys[ing.id]]
+        Ingredient.objects.using(db).bulk_update(batch, ['catalog'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False #commit each backfill batch instead of one huge transaction
+
+    dependencies = [
+        ('core', '0009_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='catalog',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='core.catalogingredient'),
+        ),
+        migrations.RunPython(backfill_catalog, migrations.RunPython.noop),
+    ]
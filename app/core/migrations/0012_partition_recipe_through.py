@@ -0,0 +1,229 @@
+# Generated by Django 3.2.23 on 2026-10-19 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PARTITIONS = 16
+BATCH_SIZE = 50000
+
+# (through table, column of the tag/ingredient, table it points at)
+THROUGH_TABLES = [
+    ('core_recipe_tags', 'tag_id', 'core_tag'),
+    ('core_recipe_ingredients', 'ingredient_id', 'core_ingredient'),
+]
+
+# The through tables are hash partitioned by recipe_id. Reading a recipe's
+# tags or ingredients, which the serializers do for every recipe listed,
+# only scans one partition. The tags and ingredients filters look rows up
+# by tag or ingredient id and probe that index in every partition.
+#
+# The partitioned table is built and filled next to the live one as
+# <table>_new, then the names are swapped in a short transaction, so the
+# API never sees a half copied table. Every step checks what is already
+# done, so a failed run can be started again and continues where it was.
+
+
+def is_partitioned(cursor, table):
+    """Return whether table already is the partitioned one."""
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+        [table],
+    )
+    return cursor.fetchone()[0]
+
+
+def table_exists(cursor, table):
+    """Return whether a table of that name exists."""
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [table])
+    return cursor.fetchone()[0]
+
+
+def create_partitioned_tables(apps, schema_editor):
+    """Create the empty partitioned <table>_new tables."""
+    with schema_editor.connection.cursor() as cursor:
+        for table, attr_column, attr_table in THROUGH_TABLES:
+            if is_partitioned(cursor, table):
+                continue
+            #Postgres requires the partition key in every unique constraint,
+            #so the primary key is (id, recipe_id). id gets its default from
+            #the old table's sequence when the tables are swapped.
+            cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table}_new (
+                id bigint NOT NULL,
+                recipe_id bigint NOT NULL
+                    CONSTRAINT {table}_part_recipe_fk REFERENCES core_recipe (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                {attr_column} bigint NOT NULL
+                    CONSTRAINT {table}_part_attr_fk REFERENCES {attr_table} (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                CONSTRAINT {table}_part_pkey PRIMARY KEY (id, recipe_id),
+                CONSTRAINT {table}_part_uniq UNIQUE (recipe_id, {attr_column})
+            ) PARTITION BY HASH (recipe_id)''')
+            for remainder in range(PARTITIONS):
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table}_p{remainder} PARTITION OF {table}_new '
+                    f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+                )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_part_attr_idx ON {table}_new ({attr_column})'
+            )
+
+
+def drop_partitioned_tables(apps, schema_editor):
+    """Drop <table>_new tables left by an unfinished run."""
+    with schema_editor.connection.cursor() as cursor:
+        for table, _, _ in THROUGH_TABLES:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}_new')
+
+
+def copy_batch(cursor, source, target, attr_column, after, until):
+    """Copy the rows with after < id <= until that are not copied yet."""
+    cursor.execute(
+        f'INSERT INTO {target} (id, recipe_id, {attr_column}) '
+        f'SELECT id, recipe_id, {attr_column} FROM {source} '
+        f'WHERE id > %s AND id <= %s '
+        f'ON CONFLICT DO NOTHING',
+        [after, until],
+    )
+
+
+def copy_through_rows(apps, schema_editor):
+    """Copy the live rows to <table>_new in id ranges, committing each batch.
+
+    Starts after the highest id already copied, and keeps going until it
+    has caught up with the rows written meanwhile.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for table, attr_column, _ in THROUGH_TABLES:
+            if is_partitioned(cursor, table):
+                continue
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}_new')
+            copied = cursor.fetchone()[0]
+            while True:
+                cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+                max_id = cursor.fetchone()[0]
+                if copied >= max_id:
+                    break
+                for start in range(copied, max_id, BATCH_SIZE):
+                    copy_batch(cursor, table, f'{table}_new', attr_column, start, start + BATCH_SIZE)
+                copied = max_id
+
+
+def swap_through_tables(apps, schema_editor):
+    """Catch up with the last writes and swap the tables, in one transaction.
+
+    Writes to the old table wait on the lock while the tail is copied and
+    the rows deleted during the copy are removed again, reads go on.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for table, attr_column, _ in THROUGH_TABLES:
+            if is_partitioned(cursor, table):
+                continue
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+            #deferred FK checks would block altering the tables below
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}_new')
+            copied = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {table}_new (id, recipe_id, {attr_column}) '
+                f'SELECT id, recipe_id, {attr_column} FROM {table} WHERE id > %s',
+                [copied],
+            )
+            cursor.execute(
+                f'DELETE FROM {table}_new new WHERE NOT EXISTS '
+                f'(SELECT 1 FROM {table} old WHERE old.id = new.id)'
+            )
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+            cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+            cursor.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+            cursor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')"
+            )
+            cursor.execute(f'DROP TABLE {table}_old')
+
+
+def unswap_through_tables(apps, schema_editor):
+    """Put plain through tables back, in one transaction."""
+    with schema_editor.connection.cursor() as cursor:
+        for table, attr_column, attr_table in THROUGH_TABLES:
+            if not is_partitioned(cursor, table):
+                continue
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+            #deferred FK checks would block altering the tables below
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            if table_exists(cursor, f'{table}_plain'):
+                cursor.execute(f'DROP TABLE {table}_plain')
+            cursor.execute(f'''CREATE TABLE {table}_plain (
+                id bigint NOT NULL DEFAULT nextval('{table}_id_seq') PRIMARY KEY,
+                recipe_id bigint NOT NULL REFERENCES core_recipe (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                {attr_column} bigint NOT NULL REFERENCES {attr_table} (id)
+                    DEFERRABLE INITIALLY DEFERRED,
+                UNIQUE (recipe_id, {attr_column})
+            )''')
+            cursor.execute(
+                f'INSERT INTO {table}_plain (id, recipe_id, {attr_column}) '
+                f'SELECT id, recipe_id, {attr_column} FROM {table}'
+            )
+            cursor.execute(f'CREATE INDEX ON {table}_plain (recipe_id)')
+            cursor.execute(f'CREATE INDEX ON {table}_plain ({attr_column})')
+            cursor.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}_plain.id')
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_plain RENAME TO {table}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False #commit each copy batch instead of one huge transaction
+
+    dependencies = [
+        ('core', '0011_usershard'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            #the tables keep their names, only the state learns the models
+            state_operations=[
+                migrations.CreateModel(
+                    name='RecipeTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tag')),
+                    ],
+                    options={
+                        'db_table': 'core_recipe_tags',
+                        'unique_together': {('recipe', 'tag')},
+                    },
+                ),
+                migrations.CreateModel(
+                    name='RecipeIngredient',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.ingredient')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+                    ],
+                    options={
+                        'db_table': 'core_recipe_ingredients',
+                        'unique_together': {('recipe', 'ingredient')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='tags',
+                    field=models.ManyToManyField(through='core.RecipeTag', to='core.Tag'),
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='ingredients',
+                    field=models.ManyToManyField(through='core.RecipeIngredient', to='core.Ingredient'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    create_partitioned_tables, drop_partitioned_tables, atomic=True
+                ),
+            ],
+        ),
+        migrations.RunPython(copy_through_rows, migrations.RunPython.noop),
+        migrations.RunPython(swap_through_tables, unswap_through_tables, atomic=True),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 3.2.23 on 2026-10-19 18:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+ID_RANGE = 50000
+
+
+def id_ranges(schema_editor, table):
+    """Yield (low, high] id ranges covering the table."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+        low, high = cursor.fetchone()
+    if low is None:
+        return
+    for start in range(low - 1, high, ID_RANGE):
+        yield start, start + ID_RANGE
+
+
+def name_catalog_entries(apps, schema_editor):
+    """Name every catalog entry after its most common spelling."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE core_catalogingredient c SET name = s.name
+            FROM (
+                SELECT DISTINCT ON (catalog_id) catalog_id, name
+                FROM core_ingredient
+                WHERE catalog_id IS NOT NULL
+                GROUP BY catalog_id, name
+                ORDER BY catalog_id, COUNT(*) DESC, name
+            ) s
+            WHERE c.id = s.catalog_id
+        """)
+        cursor.execute("UPDATE core_catalogingredient SET name = key WHERE name = ''")
+
+
+def drop_catalog_spellings(apps, schema_editor):
+    """Clear spellings equal to the catalog name, one id range at a time."""
+    for low, high in id_ranges(schema_editor, 'core_ingredient'):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE core_ingredient i SET spelling = NULL
+                FROM core_catalogingredient c
+                WHERE i.id > %s AND i.id <= %s
+                    AND i.catalog_id = c.id AND i.spelling = c.name
+            """, [low, high])
+
+
+def restore_spellings(apps, schema_editor):
+    """Copy the catalog name back into every ingredient without a spelling."""
+    for low, high in id_ranges(schema_editor, 'core_ingredient'):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE core_ingredient i SET spelling = c.name
+                FROM core_catalogingredient c
+                WHERE i.id > %s AND i.id <= %s
+                    AND i.catalog_id = c.id AND i.spelling IS NULL
+            """, [low, high])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False #commit each id range instead of one huge transaction
+
+    dependencies = [
+        ('core', '0015_job_lease'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingredient_user_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingr_name_search_idx',
+        ),
+        migrations.RenameField(
+            model_name='catalogingredient',
+            old_name='name',
+            new_name='key',
+        ),
+        migrations.AddField(
+            model_name='catalogingredient',
+            name='name',
+            field=models.CharField(default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(name_catalog_entries, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='ingredient',
+            old_name='name',
+            new_name='spelling',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='spelling',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(drop_catalog_spellings, restore_spellings),
+        migrations.AddIndex(
+            model_name='catalogingredient',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='text_pattern_ops'), name='core_catalog_name_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'catalog'], name='core_ingredient_user_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('spelling'), name='text_pattern_ops'), condition=models.Q(('spelling__isnull', False)), name='core_ingr_spelling_search_idx'),
+        ),
+        migrations.AlterModelOptions(
+            name='ingredient',
+            options={'base_manager_name': 'objects'},
+        ),
+    ]
@@ -5,8 +5,12 @@ Database models.
 import uuid
 import os
 
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Coalesce, Lower, Upper
 from django.conf import settings 
+from django.utils import timezone
+from django.contrib.postgres.indexes import OpClass
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -21,6 +25,10 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads', 'recipe', filename) #using os.path to make sure the 
                                                        #string is correct format no matter the operating system
 
+def normalize_attr_name(name):
+    """Return the canonical form of a tag or ingredient name."""
+    return ' '.join(name.split()) #trims and collapses runs of whitespace
+
 class UserManager(BaseUserManager):
     """Manager for users."""
     
@@ -57,6 +65,63 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     
     
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet for recipes."""
+    
+    def soft_delete(self):
+        """Mark the recipes deleted and uncount them, the purge removes the rows.
+        
+        Only the recipe and tag/ingredient rows are written, the through
+        tables are left alone until core.deletion.purge_deleted_recipes.
+        """
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            ids = list(
+                self.using(db).filter(deleted_at__isnull=True).select_for_update().values_list('pk', flat=True)
+            )
+            if not ids:
+                return 0
+            Recipe.all_objects.using(db).filter(pk__in=ids).update(deleted_at=timezone.now())
+            for model in (Tag, Ingredient):
+                rows, attr_field = model.objects.all()._through_rows()
+                uses = rows.filter(recipe_id__in=ids).values(attr_field).annotate(
+                    n=Count('pk')
+                ).order_by()
+                by_count = {}
+                for row in uses:
+                    by_count.setdefault(row['n'], []).append(row[attr_field])
+                for n, attr_ids in by_count.items():
+                    model.objects.filter(pk__in=attr_ids).update(recipe_count=F('recipe_count') - n)
+        return len(ids)
+    
+    def rank_by_pantry(self, ingredient_ids):
+        """Annotate how much of each recipe the given ingredients cover.
+        
+        Adds ingredient_total, pantry_matches, missing_ingredients and
+        coverage (0-1) in one grouped aggregate and drops recipes using
+        none of the ingredients. Apply it before filters joining the
+        ingredients, the counts are DISTINCT so other joins don't inflate them.
+        """
+        return self.annotate(
+            ingredient_total=Count('recipeingredient', distinct=True),
+            pantry_matches=Count(
+                'recipeingredient',
+                filter=Q(recipeingredient__ingredient_id__in=list(ingredient_ids)),
+                distinct=True,
+            ),
+        ).filter(pantry_matches__gt=0).annotate(
+            missing_ingredients=F('ingredient_total') - F('pantry_matches'),
+            coverage=Cast('pantry_matches', models.FloatField()) / F('ingredient_total'),
+        )
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    """Manager hiding soft deleted recipes."""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Recipe object in the database."""
     user = models.ForeignKey(
@@ -68,14 +133,121 @@ class Recipe(models.Model):
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
-    tags = models.ManyToManyField('Tag')
-    ingredients = models.ManyToManyField('Ingredient')
+    tags = models.ManyToManyField('Tag', through='RecipeTag')
+    ingredients = models.ManyToManyField('Ingredient', through='RecipeIngredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path) #allows you to specify a function to generate the endpoint/path name
+    deleted_at = models.DateTimeField(null=True, blank=True) #set by RecipeQuerySet.soft_delete
+    
+    objects = RecipeManager() #live recipes, also behind user.recipe_set and tag.recipe_set
+    all_objects = models.Manager() #including soft deleted ones, for the purge and the admin
+    
+    class Meta:
+        indexes = [
+            #the recipe list: user_id = ? AND deleted_at IS NULL ORDER BY id DESC
+            models.Index(
+                fields=['user', '-id'],
+                name='core_recipe_live_user_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            #lets the purge find soft deleted rows without touching live ones
+            models.Index(
+                fields=['deleted_at'],
+                name='core_recipe_deleted_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+            #back the price / time_minutes range filters and orderings per user
+            models.Index(fields=['user', 'price'], name='core_recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes'], name='core_recipe_user_time_idx'),
+            #admin prefix search: upper(title) LIKE 'ABC%'
+            models.Index(
+                OpClass(Upper('title'), name='text_pattern_ops'),
+                name='core_recipe_title_srch_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
+    def duplicate(self, **changes):
+        """Copy the recipe and its tag and ingredient links.
+        
+        Takes a fixed number of queries however many tags and ingredients
+        the recipe has. The copy points at the same image file.
+        """
+        fields = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+        }
+        fields.update(image=self.image.name, deleted_at=None, **changes)
+        db = router.db_for_write(Recipe, instance=self)
+        with transaction.atomic(using=db):
+            copy = Recipe(**fields)
+            copy.save(using=db)
+            for model in (Tag, Ingredient):
+                rows, attr_field = model.objects.all()._through_rows()
+                attr_ids = list(
+                    rows.using(db).filter(recipe_id=self.pk).values_list(attr_field, flat=True)
+                )
+                if attr_ids:
+                    rows.using(db).bulk_create([
+                        rows.model(recipe_id=copy.pk, **{attr_field: attr_id})
+                        for attr_id in attr_ids
+                    ])
+                    model.objects.using(db).filter(pk__in=attr_ids).update(
+                        recipe_count=F('recipe_count') + 1
+                    )
+        return copy
+    
+    
+class RecipeAttrQuerySet(models.QuerySet):
+    """QuerySet for tags and ingredients."""
+    
+    def _through_rows(self):
+        """Return the through table manager and the column pointing at this model."""
+        through = self.model.recipe_set.through
+        attr_field = f"{self.model._meta.model_name}_id" #tag_id or ingredient_id on the through table
+        return through.objects, attr_field
+    
+    def assigned(self):
+        """Filter to items used by at least one recipe with an EXISTS semi-join."""
+        rows, attr_field = self._through_rows()
+        return self.filter(Exists(rows.filter(
+            **{attr_field: OuterRef('pk')}, recipe__deleted_at__isnull=True
+        )))
+
+
+class RecipeAttrManager(models.Manager.from_queryset(RecipeAttrQuerySet)):
+    """Manager for tags and ingredients."""
+    
+    def name_expression(self, prefix=''):
+        """Return the expression for the name, prefix reaching it from a related model."""
+        return F(f'{prefix}name')
+    
+    def get_or_create_by_name(self, user, name):
+        """Return the user's item matching name case insensitively, creating it if needed."""
+        name = normalize_attr_name(name)
+        obj = self.annotate(name_lower=Lower('name')).filter( #uses the (user, lower(name)) index
+            user=user, name_lower=name.lower()
+        ).order_by('pk').first()
+        if obj is None:
+            obj = self.create(user=user, name=name)
+        return obj
     
+    def refresh_recipe_counts(self, ids):
+        """Recompute the denormalized recipe_count for the given ids."""
+        ids = list(ids)
+        if not ids:
+            return
+        rows, attr_field = self.get_queryset()._through_rows()
+        counts = rows.filter(
+            **{attr_field: OuterRef('pk')}, recipe__deleted_at__isnull=True
+        ).order_by().values(attr_field).annotate(count=Count('pk')).values('count')
+        self.filter(pk__in=ids).update(
+            recipe_count=Coalesce(Subquery(counts), 0)
+        )
+
+
 class Tag(models.Model):
     """Tag for filtering recipes."""
     name = models.CharField(max_length=255)
@@ -83,19 +255,292 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    recipe_count = models.PositiveIntegerField(default=0) #kept up to date by core.signals
+    
+    objects = RecipeAttrManager()
     
+    class Meta:
+        indexes = [
+            #serves the prefix autocomplete: user_id = ? AND lower(name) LIKE 'tom%'
+            models.Index(
+                F('user'),
+                OpClass(Lower('name'), name='text_pattern_ops'),
+                name='core_tag_user_name_idx',
+            ),
+            #admin prefix search: upper(name) LIKE 'ABC%'
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='core_tag_name_search_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.name
 
-class Ingredient(models.Model):
-    """Ingredients for recipes."""
+def catalog_key(name):
+    """Return the name shared catalog entries are interned under."""
+    return normalize_attr_name(name).casefold()
+
+
+class CatalogIngredientManager(models.Manager):
+    """Manager for the shared ingredient catalog."""
+    
+    def intern_many(self, names):
+        """Return {catalog key: (id, name)} for names, adding missing entries.
+        
+        A new entry is named with the first spelling it is interned with.
+        """
+        spellings = {}
+        for name in names:
+            spellings.setdefault(catalog_key(name), normalize_attr_name(name))
+        entries = self.filter(key__in=spellings)
+        found = {key: (pk, name) for key, pk, name in entries.values_list('key', 'pk', 'name')}
+        missing = set(spellings) - set(found)
+        if missing:
+            self.bulk_create(
+                [self.model(key=key, name=spellings[key]) for key in missing],
+                ignore_conflicts=True, #another request may intern the same name
+            )
+            found.update(
+                (key, (pk, name))
+                for key, pk, name in self.filter(key__in=missing).values_list('key', 'pk', 'name')
+            )
+        return found
+
+
+class CatalogIngredient(models.Model):
+    """Ingredient name shared by every user's ingredients of that name.
+    
+    Ingredients take their name from here and store their own spelling only
+    when it differs, see the catalog benchmark for the storage saved.
+    """
+    key = models.CharField(max_length=255, unique=True) #see catalog_key
     name = models.CharField(max_length=255)
+    
+    objects = CatalogIngredientManager()
+    
+    class Meta:
+        indexes = [
+            #admin prefix search: upper(name) LIKE 'ABC%'
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='core_catalog_name_search_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class IngredientManager(RecipeAttrManager):
+    """Manager for ingredients that serves their names from the catalog."""
+    
+    def name_expression(self, prefix=''):
+        return Coalesce(f'{prefix}spelling', f'{prefix}catalog__name')
+    
+    def get_queryset(self):
+        """Annotate name, so filters, ordering and values() can use it."""
+        return super().get_queryset().annotate(name=self.name_expression())
+    
+    def get_or_create_by_name(self, user, name):
+        """Return the user's ingredient matching name case insensitively, creating it if needed."""
+        name = normalize_attr_name(name)
+        obj = self.filter( #uses the (user, catalog) index
+            user=user, catalog__key=catalog_key(name)
+        ).order_by('pk').first()
+        if obj is None:
+            obj = self.create(user=user, name=name)
+        return obj
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        link_catalog([obj for obj in objs if obj.catalog_id is None or obj.name_changed()])
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+def link_catalog(ingredients):
+    """Point ingredients at their catalog entries, in memory only.
+    
+    spelling is kept only where it differs from the entry's name.
+    """
+    if not ingredients:
+        return
+    entries = CatalogIngredient.objects.intern_many(ing.name for ing in ingredients)
+    for ing in ingredients:
+        ing.catalog_id, name = entries[catalog_key(ing.name)]
+        ing.spelling = None if ing.name == name else ing.name
+
+
+class Ingredient(models.Model):
+    """Ingredients for recipes.
+    
+    The name comes from the catalog entry. spelling holds the user's own
+    spelling only where it differs from the entry's name, or when the
+    ingredient is not linked yet.
+    """
+    spelling = models.CharField(max_length=255, null=True, blank=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    recipe_count = models.PositiveIntegerField(default=0) #kept up to date by core.signals
+    catalog = models.ForeignKey(
+        CatalogIngredient,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='ingredients',
+    )
+    
+    objects = IngredientManager()
+    
+    class Meta:
+        base_manager_name = 'objects' #related lookups load the name too
+        indexes = [
+            #serves get_or_create_by_name: user_id = ? AND catalog_id = ?
+            models.Index(fields=['user', 'catalog'], name='core_ingredient_user_cat_idx'),
+            #admin prefix search on the spellings that differ from the catalog
+            models.Index(
+                OpClass(Upper('spelling'), name='text_pattern_ops'),
+                name='core_ingr_spelling_search_idx',
+                condition=Q(spelling__isnull=False),
+            ),
+        ]
+    
+    def __str__(self):
+        return self.name
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loading_name = True #the queryset sets the name annotation next
+        return instance
+    
+    @property
+    def name(self):
+        if '_name' in self.__dict__:
+            return self._name
+        return self.stored_name()
+    
+    @name.setter
+    def name(self, value):
+        if self.__dict__.pop('_loading_name', False):
+            self._loaded_name = value
+        self._name = value
+    
+    def stored_name(self):
+        """Return the name as saved, reading the catalog entry if it wasn't loaded."""
+        if '_loaded_name' in self.__dict__:
+            return self._loaded_name
+        if self.spelling is not None or self.catalog_id is None:
+            return self.spelling
+        return self.catalog.name
+    
+    def name_changed(self):
+        """Return whether name was set to something other than the saved name."""
+        return '_name' in self.__dict__ and self._name != self.stored_name()
+    
+    def refresh_from_db(self, *args, **kwargs):
+        for attr in ('_name', '_loaded_name'):
+            self.__dict__.pop(attr, None)
+        super().refresh_from_db(*args, **kwargs)
     
+    def save(self, *args, **kwargs):
+        """Link the ingredient to the catalog entry for a new or changed name."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'name' in update_fields:
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'spelling', 'catalog'} - {'name'}
+            if self.catalog_id is None or self.name_changed():
+                link_catalog([self])
+        super().save(*args, **kwargs)
+        if '_name' in self.__dict__:
+            self._loaded_name = self._name
+
+
+class RecipeTag(models.Model):
+    """Recipe/tag through row.
+    
+    The table keeps the name Django gave the implicit through table and is
+    hash partitioned by recipe_id in Postgres, see migration 0012.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    
+    class Meta:
+        db_table = 'core_recipe_tags'
+        unique_together = [('recipe', 'tag')]
+
+
+class RecipeIngredient(models.Model):
+    """Recipe/ingredient through row, partitioned like RecipeTag."""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    
+    class Meta:
+        db_table = 'core_recipe_ingredients'
+        unique_together = [('recipe', 'ingredient')]
+
+
+class Job(models.Model):
+    """Background job, run by the run_worker command."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=255) #key into core.jobs.JOBS
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True) #traceback of the last failed attempt
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now) #pushed back between retries
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True) #renewed while the job reports progress
+    
+    class Meta:
+        indexes = [
+            #the worker polls for the oldest queued job that is due
+            models.Index(
+                fields=['id'],
+                name='core_job_queued_idx',
+                condition=models.Q(status='queued'),
+            ),
+            #and for running jobs whose worker was lost
+            models.Index(
+                fields=['lease_expires_at'],
+                name='core_job_running_idx',
+                condition=models.Q(status='running'),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
+
+
+
+class UserShard(models.Model):
+    """Shard holding a user's recipes, tags and ingredients, see core.sharding.
+    
+    Lives on the default database. Users without a row are on default.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    alias = models.CharField(max_length=64) #key into settings.DATABASES
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.user_id} on {self.alias}"
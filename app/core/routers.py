@@ -0,0 +1,78 @@
+"""
+Database routers.
+
+ShardRouter sends recipe data to the shard of the user it belongs to, see
+core.sharding.
+
+ReplicaRouter sends the reads made while serving a safe request to one of
+the read replicas in settings.DATABASE_REPLICAS. Writes, requests from a
+client that wrote recently, management commands and the job worker all
+use the primary, see core.middleware.ReplicaRoutingMiddleware.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from core.models import User
+from core.sharding import SHARDED_MODELS, current_shard, is_sharded, shard_for_user
+
+_read_from_replicas = ContextVar('read_from_replicas', default=False)
+
+
+@contextmanager
+def read_from_replicas(enabled=True):
+    """Route the reads made inside the block to the replicas."""
+    token = _read_from_replicas.set(enabled)
+    try:
+        yield
+    finally:
+        _read_from_replicas.reset(token)
+
+
+class ShardRouter:
+    """Route sharded models to the shard of the instance or current user."""
+
+    def _db_for_model(self, model, **hints):
+        if not is_sharded() or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, User):
+            #user.recipe_set and the like
+            return shard_for_user(instance.pk)
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if getattr(instance, 'user_id', None) is not None:
+            return shard_for_user(instance.user_id)
+        return current_shard()
+
+    db_for_read = _db_for_model
+    db_for_write = _db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._meta.label_lower, obj2._meta.label_lower} <= SHARDED_MODELS:
+            return obj1._state.db == obj2._state.db
+        return None
+
+
+class ReplicaRouter:
+    """Route reads to a random replica when the current context allows it."""
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _read_from_replicas.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        #replicas get the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
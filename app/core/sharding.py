@@ -0,0 +1,226 @@
+"""
+Sharding of recipe data by user.
+
+Recipes, tags, ingredients, their through rows and the ingredient catalog
+live on the shard of the user they belong to, settings.DATABASE_SHARDS
+lists the aliases. Users, tokens and jobs stay on the default database,
+each shard holds a stub row for its users so the foreign keys hold.
+
+New users are placed by a hash of their id and the placement is recorded
+in UserShard, so adding shards never moves existing users. Users created
+before sharding was enabled have no row and stay on default. The
+move_user command moves a user's data to another shard.
+
+Moved rows keep their ids, which clients, pagination cursors and image
+paths refer to. So every shard hands out recipe, tag and ingredient ids
+from its own range, see reserve_id_range.
+"""
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+from core.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User, UserShard,
+)
+
+SHARDED_MODELS = {
+    'core.recipe',
+    'core.recipetag',
+    'core.recipeingredient',
+    'core.tag',
+    'core.ingredient',
+    'core.catalogingredient',
+}
+
+BATCH_SIZE = 1000
+SHARD_ID_SPAN = 10 ** 12 #ids shard n hands out start at n * SHARD_ID_SPAN
+ID_MODELS = [Recipe, Tag, Ingredient] #the ids the API exposes
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+def is_sharded():
+    """Return whether more than one shard is configured."""
+    return len(settings.DATABASE_SHARDS) > 1
+
+
+def current_shard():
+    """Return the shard the current request or block is routed to, if any."""
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """Route queries on sharded models made inside the block to alias."""
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def hashed_shard(user_id):
+    """Return the shard a new user is placed on."""
+    shards = settings.DATABASE_SHARDS
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def shard_cache_key(user_id):
+    """Return the cache key holding the shard of a user."""
+    return f'db:shard:{user_id}'
+
+
+def lookup_shard(user_id):
+    """Return the shard of a user from the shard map."""
+    alias = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=user_id
+    ).values_list('alias', flat=True).first()
+    return alias or DEFAULT_DB_ALIAS
+
+
+def shard_for_user(user_id):
+    """Return the shard of a user, cached for DATABASE_SHARD_MAP_TIMEOUT."""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    key = shard_cache_key(user_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = lookup_shard(user_id)
+        cache.set(key, alias, settings.DATABASE_SHARD_MAP_TIMEOUT)
+    return alias
+
+
+def mirror_user(user, alias):
+    """Create or refresh the stub row a shard needs to reference the user.
+
+    Another stub still holding the email, from a change that was never
+    mirrored, is given a placeholder first so the unique email can't
+    reject this one. Stubs are written without sending signals.
+    """
+    users = User.objects.using(alias)
+    users.filter(email=user.email).exclude(pk=user.pk).update(email=Concat(
+        Value('stale-'), Cast('id', CharField()), Value('@shard.invalid')
+    ))
+    if users.filter(pk=user.pk).update(email=user.email, name=user.name):
+        return
+    stub = User(id=user.id, email=user.email, name=user.name, is_active=False)
+    stub.set_unusable_password()
+    users.bulk_create([stub])
+
+
+def assign_shard(user):
+    """Place a new user on a shard, called when the user is created."""
+    if not is_sharded():
+        return
+    alias = hashed_shard(user.id)
+    UserShard.objects.using(DEFAULT_DB_ALIAS).create(user=user, alias=alias)
+    if alias != DEFAULT_DB_ALIAS:
+        mirror_user(user, alias)
+
+
+def reserve_id_range(alias):
+    """Start the shard's id sequences in its own range, run after migrate.
+
+    Rows created on a shard before its range was reserved can share ids
+    with rows on other shards. Moving them then fails on the primary key
+    and leaves both shards as they were.
+    """
+    start = settings.DATABASE_SHARDS.index(alias) * SHARD_ID_SPAN
+    if not start:
+        return
+    with connections[alias].cursor() as cursor:
+        for model in ID_MODELS:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [model._meta.db_table])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f'SELECT last_value FROM {sequence}')
+            if cursor.fetchone()[0] < start:
+                cursor.execute('SELECT setval(%s, %s, false)', [sequence, start])
+
+
+def _copy(model, objs, **changes):
+    """Insert copies of objs in bulk, keeping their primary keys."""
+    for obj in objs:
+        for field, value in changes.items():
+            setattr(obj, field, value)
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+
+def move_user_data(user, target):
+    """Move a user's recipes, tags, ingredients and through rows to target.
+
+    The rows are copied in one transaction on the target, the shard map is
+    switched and then the rows are deleted from the source. Writes the user
+    makes during the move, or on hosts with the old shard still cached, are
+    lost, so run it while the user is not writing.
+    """
+    source = lookup_shard(user.id)
+    if source == target:
+        return None
+    with use_shard(source):
+        tags = list(Tag.objects.filter(user=user))
+        ingredients = list(Ingredient.objects.filter(user=user))
+        recipes = list(Recipe.all_objects.filter(user=user)) #soft deleted ones too
+        recipe_tags = list(RecipeTag.objects.filter(
+            recipe__user=user
+        ).values_list('recipe_id', 'tag_id'))
+        recipe_ingredients = list(RecipeIngredient.objects.filter(
+            recipe__user=user
+        ).values_list('recipe_id', 'ingredient_id'))
+
+    if target != DEFAULT_DB_ALIAS:
+        mirror_user(user, target)
+    with use_shard(target), transaction.atomic(using=target):
+        _copy(Tag, tags)
+        #the catalog is per shard, IngredientManager.bulk_create relinks it
+        _copy(Ingredient, ingredients, catalog_id=None)
+        _copy(Recipe, recipes)
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id, tag_id in recipe_tags
+        ], batch_size=BATCH_SIZE)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id)
+            for recipe_id, ingredient_id in recipe_ingredients
+        ], batch_size=BATCH_SIZE)
+
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user=user, defaults={'alias': target}
+    )
+    cache.delete(shard_cache_key(user.id))
+
+    with use_shard(source), transaction.atomic(using=source):
+        #through rows first, then nothing is left to recount
+        RecipeTag.objects.filter(recipe__user=user).delete()
+        RecipeIngredient.objects.filter(recipe__user=user).delete()
+        Recipe.all_objects.filter(user=user).delete()
+        Tag.objects.filter(user=user).delete()
+        Ingredient.objects.filter(user=user).delete()
+        if source != DEFAULT_DB_ALIAS:
+            User.objects.using(source).filter(pk=user.pk).delete()
+
+    return {
+        'recipes': len(recipes),
+        'tags': len(tags),
+        'ingredients': len(ingredients),
+        'through rows': len(recipe_tags) + len(recipe_ingredients),
+    }
+
+
+class ShardRoutingMixin:
+    """View mixin routing sharded models to the request user's shard."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_shard(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs) #authenticates the user
+        if is_sharded() and request.user.is_authenticated:
+            #reset when dispatch leaves use_shard
+            _current_shard.set(shard_for_user(request.user.id))
@@ -0,0 +1,155 @@
+"""
+Signal handlers for core models.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_migrate, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_cached_user, user_cache_key
+from core.models import Recipe, Tag, Ingredient, User
+from core.sharding import (
+    assign_shard, is_sharded, lookup_shard, mirror_user, reserve_id_range,
+)
+from core.similarity import record_change_on_commit
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_counts(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Keep recipe_count on tags and ingredients in sync with the through tables."""
+    if reverse:
+        #tag.recipe_set.add(...) - only the tag/ingredient itself changes
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.__class__.objects.refresh_recipe_counts([instance.pk])
+        return
+
+    if action == 'pre_clear':
+        #clear() does not send the pk_set, so remember what is about to go
+        pending = getattr(instance, '_cleared_attr_ids', {})
+        pending[sender] = list(
+            sender.objects.filter(recipe_id=instance.pk).values_list(
+                f"{model._meta.model_name}_id", flat=True
+            )
+        )
+        instance._cleared_attr_ids = pending
+    elif action == 'post_clear':
+        ids = getattr(instance, '_cleared_attr_ids', {}).pop(sender, [])
+        model.objects.refresh_recipe_counts(ids)
+    elif action in ('post_add', 'post_remove'):
+        model.objects.refresh_recipe_counts(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def log_link_changes(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Log the recipes whose links changed for the similarity indexes."""
+    if action.startswith('pre_'):
+        return
+    if not reverse:
+        record_change_on_commit(instance.user_id, [instance.pk], using=using)
+    elif action == 'post_clear':
+        #tag.recipe_set.clear() - the tag/ingredient left every recipe
+        feature = (instance._meta.model_name, instance.pk)
+        record_change_on_commit(instance.user_id, features=[feature], using=using)
+    else:
+        record_change_on_commit(instance.user_id, pk_set, using=using)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def log_recipe_change(sender, instance, using, created=False, **kwargs):
+    """Log a saved or deleted recipe, a new one has no links yet."""
+    if not created:
+        record_change_on_commit(instance.user_id, [instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_attr_deleted(sender, instance, using, **kwargs):
+    """Log a deleted tag or ingredient for the similarity indexes."""
+    feature = (instance._meta.model_name, instance.pk)
+    record_change_on_commit(instance.user_id, features=[feature], using=using)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_attrs(sender, instance, **kwargs):
+    """Collect the tags and ingredients of a recipe before it is deleted."""
+    instance._deleted_attr_ids = (
+        list(instance.tags.values_list('pk', flat=True)),
+        list(instance.ingredients.values_list('pk', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_attrs(sender, instance, **kwargs):
+    """Recount the tags and ingredients a deleted recipe was using."""
+    tag_ids, ing_ids = getattr(instance, '_deleted_attr_ids', ([], []))
+    Tag.objects.refresh_recipe_counts(tag_ids)
+    Ingredient.objects.refresh_recipe_counts(ing_ids)
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, created, **kwargs):
+    """Drop the cached auth user when the user changes, e.g. UserSerializer.update."""
+    if not created:
+        invalidate_cached_user(instance)
+
+
+@receiver(pre_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Drop the cached auth user of a deleted user, while the tokens still exist."""
+    invalidate_cached_user(instance)
+
+
+@receiver(post_delete, sender=Token)
+def forget_revoked_token(sender, instance, **kwargs):
+    """Stop a deleted token (logout, rotation) authenticating from the cache."""
+    cache.delete(user_cache_key(instance.key))
+
+
+@receiver(post_save, sender=User)
+def place_new_user(sender, instance, created, using, **kwargs):
+    """Put a new user on a shard, see core.sharding."""
+    if created and using == DEFAULT_DB_ALIAS:
+        assign_shard(instance)
+
+
+@receiver(post_save, sender=User)
+def update_user_stub(sender, instance, created, using, update_fields, **kwargs):
+    """Copy an email or name change to the user's stub on their shard."""
+    if created or using != DEFAULT_DB_ALIAS or not is_sharded():
+        return
+    if update_fields is not None and not {'email', 'name'} & set(update_fields):
+        return
+    alias = lookup_shard(instance.pk)
+    if alias != DEFAULT_DB_ALIAS:
+        mirror_user(instance, alias)
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_shard(sender, instance, using, **kwargs):
+    """Look up the user's shard before the UserShard row is cascaded away."""
+    if is_sharded() and using == DEFAULT_DB_ALIAS:
+        instance._shard = lookup_shard(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_data(sender, instance, using, **kwargs):
+    """Delete the user's stub on their shard, cascading to their recipe data."""
+    shard = getattr(instance, '_shard', DEFAULT_DB_ALIAS)
+    if using == DEFAULT_DB_ALIAS and shard != DEFAULT_DB_ALIAS:
+        User.objects.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    """Give a migrated shard its own id range, see core.sharding."""
+    if sender.label == 'core' and using in settings.DATABASE_SHARDS:
+        reserve_id_range(using)
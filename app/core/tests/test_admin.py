@@ -6,6 +6,10 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client 
+from unittest.mock import patch
+
+from core import models
+from core.admin import EstimatedCountPaginator
 
 
 class AdminSiteTests(TestCase):
@@ -48,4 +52,51 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
         
-        self.assertEqual(res.status_code, 200)
\ No newline at end of file
+        self.assertEqual(res.status_code, 200)
+        
+        
+    def test_recipe_attr_changelists(self):
+        """Test the recipe, tag and ingredient changelists render and search."""
+        tag = models.Tag.objects.create(user=self.user, name='Dinner')
+        ing = models.Ingredient.objects.create(user=self.user, name='Rice')
+        recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Fried Rice',
+            time_minutes=15,
+            price='4.00'
+        )
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ing)
+        
+        for name, match in [('recipe', 'Fried Rice'), ('tag', 'Dinner'), ('ingredient', 'Rice')]:
+            url = reverse(f'admin:core_{name}_changelist')
+            res = self.client.get(url, {'q': match[:3].lower()})
+            
+            self.assertEqual(res.status_code, 200)
+            self.assertContains(res, match)
+            
+    def test_recipe_change_page(self):
+        """Test the recipe edit page uses raw id widgets."""
+        recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Fried Rice',
+            time_minutes=15,
+            price='4.00'
+        )
+        url = reverse('admin:core_recipe_change', args=[recipe.id])
+        res = self.client.get(url)
+        
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'vManyToManyRawIdAdminField')
+        
+    def test_estimated_count_for_large_tables(self):
+        """Test unfiltered changelists use the planner estimate."""
+        queryset = models.Recipe.all_objects.all() #what RecipeAdmin lists
+        with patch.object(EstimatedCountPaginator, '_estimate', return_value=5000000):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 5000000)
+            filtered = queryset.filter(title__startswith='A')
+            self.assertEqual(EstimatedCountPaginator(filtered, 100).count, 0)
+        
+        with patch.object(EstimatedCountPaginator, '_estimate', return_value=-1):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 0)
+
@@ -2,35 +2,232 @@
 Test custom Django management commands.
 """
 
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 
+from rest_framework.authtoken.models import Token
 
-@patch("core.management.commands.wait_for_db.Command.check")
+from core.management.commands.profile_imports import parse_importtime
+
+
+@patch("core.management.commands.wait_for_db.Command.check_database")
 class CommandTests(SimpleTestCase):
     """Test Commands"""
 
     def test_wait_for_db_ready(self, patched_check):
         """Test waiting for databse if database is ready"""
-        patched_check.return_value = True
+        patched_check.return_value = None
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
 
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_check.assert_called_once_with('default', False)
 
     @patch('time.sleep')
     def test_wait_for_db_delay(self, patched_sleep, patched_check):
         """Test waiting for databse when getting OperationalError"""
 
         patched_check.side_effect = [Psycopg2OpError] * 2 + \
-            [OperationalError] * 3 + [True]
+            [OperationalError] * 3 + [None]
 
-        call_command('wait_for_db')
+        call_command('wait_for_db', stdout=StringIO())
 
         self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        patched_check.assert_called_with('default', False)
+        self.assertEqual(patched_sleep.call_count, 5)
+
+    @patch('random.uniform', side_effect=lambda low, high: high)
+    @patch('time.sleep')
+    def test_wait_for_db_backoff(self, patched_sleep, patched_uniform, patched_check):
+        """Test the delay doubles on each retry up to --max-delay"""
+        patched_check.side_effect = [OperationalError] * 5 + [None]
+
+        call_command(
+            'wait_for_db', '--initial-delay', '0.1', '--max-delay', '0.5',
+            stdout=StringIO(),
+        )
+
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(delays, [0.1, 0.2, 0.4, 0.5, 0.5])
+
+    def test_wait_for_db_timeout(self, patched_check):
+        """Test giving up once --timeout has passed"""
+        patched_check.side_effect = OperationalError('connection refused')
+
+        with self.assertRaisesRegex(CommandError, 'connection refused'):
+            call_command('wait_for_db', '--timeout', '0', stdout=StringIO())
+
+
+class WaitForDbTests(TestCase):
+    """Test wait_for_db against the test database."""
+
+    def test_wait_for_db_migrations_and_warm(self):
+        """Test the migration check passes and warm-up touches every table"""
+        out = StringIO()
+
+        call_command('wait_for_db', '--migrations', '--warm', stdout=out)
+
+        self.assertIn('default ready in', out.getvalue())
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test the benchmark command."""
+
+    def test_assigned_only_benchmark(self):
+        """Test the benchmark reports timings and leaves no data behind"""
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'assigned_only', '--rows', '50', '--repeat', '1',
+            stdout=out
+        )
+
+        self.assertIn('exists_ms', out.getvalue())
+        self.assertIn('through_rows: 50', out.getvalue())
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_pantry_benchmark(self):
+        """Test the pantry benchmark times every pantry size"""
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'pantry', '--rows', '20', '--repeat', '1',
+            stdout=out
+        )
+
+        self.assertIn('pantry_1000_ms', out.getvalue())
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_catalog_benchmark(self):
+        """Test the catalog benchmark measures storage before and after"""
+        out = StringIO()
+
+        call_command(
+            'benchmark', 'catalog', '--rows', '2', '--repeat', '1',
+            stdout=out
+        )
+
+        self.assertIn('ingredient_row_bytes_before', out.getvalue())
+        self.assertIn('ingredient_row_bytes_after', out.getvalue())
+        self.assertIn('catalog_entries: 200', out.getvalue())
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class BulkCreateUsersTests(TestCase):
+    """Test the bulk_create_users command."""
+
+    def run_import(self, content, suffix):
+        """Write content to a temporary file and import it."""
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        out, err = StringIO(), StringIO()
+        call_command(
+            'bulk_create_users', f.name, '--workers', '0', '--batch-size', '2',
+            stdout=out, stderr=err
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv_creates_users_and_tokens(self):
+        """Test users from a CSV get hashed passwords and tokens"""
+        get_user_model().objects.create_user('taken@example.com', 'pass12345')
+        content = (
+            'email,password,name\n'
+            'one@example.com,pass12345,One\n'
+            'two@example.com,pass12345,Two\n'
+            'taken@example.com,pass12345,Taken\n'
+            'not-an-email,pass12345,Bad\n'
+            'one@example.com,pass12345,Again\n'
+        )
+
+        out, err = self.run_import(content, '.csv')
+
+        user = get_user_model().objects.get(email='one@example.com')
+        self.assertTrue(user.check_password('pass12345'))
+        self.assertEqual(user.name, 'One')
+        self.assertTrue(Token.objects.filter(user=user).exists())
+        self.assertIn('Created 2 users, 3 failed', out)
+        self.assertIn('line 4: user taken@example.com already exists', err)
+        self.assertIn('line 5: invalid email', err)
+        self.assertIn('line 6: duplicate email', err)
+
+    def test_import_ndjson(self):
+        """Test users can be imported from newline delimited JSON"""
+        content = (
+            '{"email": "one@example.com", "password": "pass12345"}\n'
+            '\n'
+            '{"email": "two@example.com", "password": "pass12345"}\n'
+        )
+
+        out, err = self.run_import(content, '.ndjson')
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(err, '')
+
+    def test_import_ndjson_malformed_line(self):
+        """Test a malformed NDJSON line is reported and the import goes on"""
+        content = (
+            '{"email": "one@example.com", "password": "pass12345"}\n'
+            '{"email": "two@example.com", \n'
+            '["not", "an", "object"]\n'
+            '{"email": "three@example.com", "password": "pass12345"}\n'
+        )
+
+        out, err = self.run_import(content, '.ndjson')
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertIn('Created 2 users, 2 failed', out)
+        self.assertIn('line 2: invalid JSON', err)
+        self.assertIn('line 3: expected a JSON object', err)
+
+    def test_import_ndjson_wrong_types(self):
+        """Test rows with non-text fields are reported and the import goes on"""
+        content = (
+            '{"email": 5}\n'
+            '{"email": "two@example.com", "password": 12345}\n'
+            '{"email": "three@example.com", "name": ["Three"]}\n'
+            '{"email": "four@example.com", "password": "pass12345"}\n'
+        )
+
+        out, err = self.run_import(content, '.ndjson')
+
+        self.assertEqual(get_user_model().objects.get().email, 'four@example.com')
+        self.assertIn('Created 1 users, 3 failed', out)
+        self.assertIn('line 1: email must be text', err)
+        self.assertIn('line 2: password must be text', err)
+        self.assertIn('line 3: name must be text', err)
+
+
+class ProfileImportsTests(SimpleTestCase):
+    """Test the profile_imports command."""
+
+    def test_parse_importtime(self):
+        """Test -X importtime lines are parsed into module timings"""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   encodings.aliases\n'
+            'import time:      3000 |       4500 | django\n'
+        )
+
+        rows = parse_importtime(output)
+
+        self.assertEqual(rows, [('encodings.aliases', 120, 120), ('django', 3000, 4500)])
+
+    def test_views_do_not_import_schema_generation(self):
+        """Test serving requests does not load drf_spectacular's AutoSchema"""
+        out = StringIO()
+
+        call_command('profile_imports', 'app.urls', '--top', '5', stdout=out)
+
+        self.assertIn('ms to import app.urls', out.getvalue())
+        self.assertNotIn('drf_spectacular.openapi was imported eagerly', out.getvalue())
+
@@ -0,0 +1,96 @@
+"""
+Tests for tag and ingredient deduplication.
+"""
+
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.dedupe import find_duplicate_groups, match_key
+from core.models import Ingredient, Recipe, Tag
+
+
+class FindDuplicatesTests(SimpleTestCase):
+    """Test the duplicate detection."""
+
+    def test_match_key(self):
+        """Test case, whitespace and plurals share a key"""
+        self.assertEqual(match_key(' Tomatoes '), 'tomato')
+        self.assertEqual(match_key('tomato'), 'tomato')
+        self.assertEqual(match_key('Green   Beans'), 'green bean')
+
+    def test_groups_keep_most_used_first(self):
+        """Test groups are ordered with the most used item first"""
+        items = [
+            (1, 'Tomato', 1),
+            (2, 'tomato ', 4),
+            (3, 'Tomatoes', 0),
+            (4, 'Basil', 2),
+        ]
+
+        groups = find_duplicate_groups(items)
+
+        self.assertEqual(groups, [[2, 1, 3]])
+
+    def test_neighbors_within_threshold_merge(self):
+        """Test typos close in sort order are grouped"""
+        items = [(1, 'Cinnamon', 3), (2, 'Cinammon', 0), (3, 'Cilantro', 1)]
+
+        groups = find_duplicate_groups(items, threshold=0.85)
+
+        self.assertEqual(groups, [[1, 2]])
+
+    def test_similar_names_not_merged_by_default(self):
+        """Test different items with similar names stay apart"""
+        items = [(1, 'Peas', 2), (2, 'Pear', 1), (3, 'Cinnamon', 3), (4, 'Cinammon', 0)]
+
+        self.assertEqual(find_duplicate_groups(items), [])
+        self.assertEqual(find_duplicate_groups([(1, 'Peas', 2), (2, 'Pear', 1)], threshold=0.85), [])
+
+    def test_singular_endings_kept(self):
+        """Test words only looking plural keep their ending"""
+        self.assertEqual(match_key('Hummus'), 'hummus')
+        self.assertEqual(match_key('Swiss Cheese'), 'swiss cheese')
+        self.assertEqual(match_key('Cherries'), 'cherry')
+
+
+class DedupeCommandTests(TestCase):
+    """Test the dedupe_attrs command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+
+    def test_dedupe_merges_per_user(self):
+        """Test duplicates are merged into one row used by every recipe"""
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        unused = Ingredient.objects.create(user=self.user, name='Tomato')
+        used = Ingredient.objects.create(user=self.user, name='Tomatoes')
+        untouched = Ingredient.objects.create(user=other, name='tomato')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=Decimal('3.00')
+        )
+        recipe.ingredients.add(used)
+
+        call_command('dedupe_attrs', '--model', 'ingredient', '--apply', stdout=StringIO())
+
+        self.assertFalse(Ingredient.objects.filter(pk=unused.id).exists())
+        used.refresh_from_db()
+        self.assertEqual(used.recipe_count, 1)
+        self.assertEqual(list(recipe.ingredients.all()), [used])
+        self.assertTrue(Ingredient.objects.filter(pk=untouched.id).exists())
+
+    def test_reports_without_apply(self):
+        """Test the groups are only reported without --apply"""
+        Tag.objects.create(user=self.user, name='Dinner')
+        Tag.objects.create(user=self.user, name='dinner')
+        out = StringIO()
+
+        call_command('dedupe_attrs', stdout=out)
+
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertIn("'Dinner' <- 'dinner'", out.getvalue())
@@ -0,0 +1,146 @@
+"""
+Tests for set based deletion.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.deletion import delete_recipes, delete_user, purge_deleted_recipes
+from core.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+
+
+def create_recipes(user, count, tags=(), ingredients=()):
+    """Create count recipes using the given tags and ingredients."""
+    recipes = Recipe.objects.bulk_create([
+        Recipe(user=user, title=f'Recipe {i}', time_minutes=5, price=Decimal('1.00'))
+        for i in range(count)
+    ])
+    for recipe in recipes:
+        recipe.tags.add(*tags)
+        recipe.ingredients.add(*ingredients)
+    return recipes
+
+
+class DeletionTests(TestCase):
+    """Test deleting recipes and users without the collector."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+
+    def test_delete_recipes(self):
+        """Test recipes and through rows go and the kept recipes still count"""
+        recipes = create_recipes(self.user, 5, [self.tag], [self.ingredient])
+
+        deleted = delete_recipes([recipe.pk for recipe in recipes[:3]], chunk_size=2)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(RecipeTag.objects.count(), 2)
+        self.assertEqual(RecipeIngredient.objects.count(), 2)
+        self.tag.refresh_from_db()
+        self.ingredient.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 2)
+        self.assertEqual(self.ingredient.recipe_count, 2)
+
+    def test_delete_recipes_query_count(self):
+        """Test the queries per chunk do not grow with the number of recipes"""
+        few = [r.pk for r in create_recipes(self.user, 2, [self.tag], [self.ingredient])]
+        many = [r.pk for r in create_recipes(self.user, 40, [self.tag], [self.ingredient])]
+
+        with CaptureQueriesContext(connection) as few_queries:
+            delete_recipes(few)
+        with CaptureQueriesContext(connection) as many_queries:
+            delete_recipes(many)
+
+        self.assertEqual(len(few_queries), len(many_queries))
+
+    def test_delete_user(self):
+        """Test a user's recipes, tags and ingredients are deleted in chunks"""
+        create_recipes(self.user, 7, [self.tag], [self.ingredient])
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        create_recipes(other, 1)
+        progress = []
+
+        delete_user(self.user, chunk_size=3, on_chunk=progress.append)
+
+        self.assertEqual(progress, [3, 6, 7])
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Recipe.objects.values_list('user', flat=True)), [other.pk])
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(RecipeTag.objects.exists())
+
+    def test_soft_delete(self):
+        """Test soft deleted recipes are hidden and no longer counted"""
+        recipes = create_recipes(self.user, 3, [self.tag], [self.ingredient])
+
+        deleted = Recipe.objects.filter(pk__in=[r.pk for r in recipes[:2]]).soft_delete()
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(list(Recipe.objects.values_list('pk', flat=True)), [recipes[2].pk])
+        self.assertEqual(Recipe.all_objects.count(), 3)
+        self.assertEqual(RecipeTag.objects.count(), 3) #left for the purge
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+        self.assertEqual(list(self.tag.recipe_set.all()), [recipes[2]])
+
+        Recipe.objects.filter(pk=recipes[2].pk).soft_delete()
+
+        self.assertFalse(Tag.objects.assigned().exists())
+        Tag.objects.refresh_recipe_counts([self.tag.pk])
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 0)
+
+    def test_purge_deleted_recipes(self):
+        """Test the purge hard deletes only recipes deleted long enough ago"""
+        old, recent, live = create_recipes(self.user, 3, [self.tag])
+        Recipe.objects.filter(pk__in=[old.pk, recent.pk]).soft_delete()
+        Recipe.all_objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=2))
+
+        purged = purge_deleted_recipes(timezone.now() - timedelta(days=1))
+
+        self.assertEqual(purged, 1)
+        self.assertEqual(
+            set(Recipe.all_objects.values_list('pk', flat=True)), {recent.pk, live.pk}
+        )
+        self.assertFalse(RecipeTag.objects.filter(recipe_id=old.pk).exists())
+
+    @patch('django.core.files.storage.FileSystemStorage.delete')
+    def test_purge_keeps_shared_images(self, mock_delete):
+        """Test the purge leaves an image a duplicate still points at"""
+        shared, own = create_recipes(self.user, 2)
+        Recipe.objects.filter(pk=shared.pk).update(image='uploads/recipe/shared.jpg')
+        Recipe.objects.filter(pk=own.pk).update(image='uploads/recipe/own.jpg')
+        shared.refresh_from_db()
+        shared.duplicate()
+        Recipe.objects.filter(pk__in=[shared.pk, own.pk]).soft_delete()
+
+        purge_deleted_recipes(timezone.now())
+
+        mock_delete.assert_called_once_with('uploads/recipe/own.jpg')
+
+    def test_purge_recipes_command(self):
+        """Test purge_recipes purges in the foreground or queues a job"""
+        recipe, = create_recipes(self.user, 1)
+        Recipe.objects.filter(pk=recipe.pk).soft_delete()
+        out = StringIO()
+
+        call_command('purge_recipes', '--older-than', '0', '--pause', '0', stdout=out)
+
+        self.assertIn('Purged 1 recipes', out.getvalue())
+        self.assertFalse(Recipe.all_objects.exists())
+
+        call_command('purge_recipes', '--background', stdout=out)
+
+        self.assertIn('Queued purge_recipes', out.getvalue())
+
@@ -0,0 +1,61 @@
+"""
+Tests for the password hashers and the hashing slots.
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.test import SimpleTestCase, override_settings
+
+from core import hashers
+
+
+class FakeUWSGICache:
+    """The uwsgi cache calls hashing_slot uses, kept in a dict."""
+
+    def __init__(self):
+        self.keys = {}
+
+    def cache_set(self, key, value, expires, cache_name):
+        if key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    def cache_del(self, key, cache_name):
+        return self.keys.pop(key, None) is not None
+
+
+@override_settings(PASSWORD_ARGON2_MEMORY_COST=1024, PASSWORD_ARGON2_PARALLELISM=1)
+class HasherTests(SimpleTestCase):
+    """Test the tunable hashers."""
+
+    def test_argon2_hasher(self):
+        """Test the Argon2 hasher hashes and verifies with the set costs"""
+        encoded = make_password('testpass123', hasher='argon2')
+
+        self.assertIn('m=1024', encoded)
+        self.assertTrue(check_password('testpass123', encoded))
+
+
+@override_settings(PASSWORD_HASH_CONCURRENCY=2, PASSWORD_HASH_WAIT=0.05)
+class HostHashingSlotTests(SimpleTestCase):
+    """Test the slots shared by the uwsgi workers of a host."""
+
+    def setUp(self):
+        self.uwsgi = FakeUWSGICache()
+        patcher = patch.object(hashers, 'uwsgi', self.uwsgi)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_slots_bound_the_host(self):
+        """Test a third login waits and gives up while two hash"""
+        with hashers.hashing_slot(), hashers.hashing_slot():
+            self.assertEqual(len(self.uwsgi.keys), 2)
+            with self.assertRaises(hashers.HashingBusy):
+                with hashers.hashing_slot():
+                    pass
+
+        self.assertEqual(self.uwsgi.keys, {})
+        with hashers.hashing_slot():
+            pass
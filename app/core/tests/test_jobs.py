@@ -0,0 +1,278 @@
+"""
+Tests for background jobs.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job, Recipe, Tag, Ingredient
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def run_worker():
+    """Run every queued job."""
+    call_command('run_worker', '--once', stdout=StringIO())
+
+
+class JobTests(TestCase):
+    """Test the job queue and the admin jobs."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+
+    def test_unknown_job_rejected(self):
+        """Test enqueueing a job that is not registered fails"""
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_job')
+
+    @override_settings(JOB_RETRY_DELAY=10, JOB_RETRY_MAX_DELAY=15)
+    def test_failed_job_retried_with_backoff(self):
+        """Test an exception queues the job again later until attempts run out"""
+        job = jobs.enqueue('delete_objects', model='core.nosuchmodel', ids=[1])
+
+        run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('LookupError', job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=9))
+        self.assertEqual(jobs.retry_delay(2), timedelta(seconds=15))
+
+        run_worker() #not due yet
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+
+        Job.objects.filter(pk=job.pk).update(attempts=2, run_after=timezone.now())
+        run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+
+    def test_lost_job_queued_again(self):
+        """Test a running job whose lease ran out is claimed again"""
+        job = jobs.enqueue('delete_objects', model='core.recipe', ids=[])
+        jobs.claim_next_job()
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        claimed = jobs.claim_next_job()
+
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertIn('lease expired', Job.objects.get(pk=job.pk).error)
+
+    def test_lost_job_failed_after_last_attempt(self):
+        """Test a lost job that used up its attempts is failed"""
+        job = jobs.enqueue('delete_objects', model='core.recipe', ids=[])
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=3,
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+
+        self.assertIsNone(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_LEASE_SECONDS=60)
+    def test_progress_renews_lease(self):
+        """Test reporting progress keeps a long job's lease"""
+        job = jobs.enqueue('delete_objects', model='core.recipe', ids=[])
+        claimed = jobs.claim_next_job()
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now())
+
+        jobs.report_progress(claimed, 1, 10)
+
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=50))
+        self.assertIsNone(jobs.claim_next_job())
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+    def test_lost_worker_result_discarded(self):
+        """Test a worker finishing after losing its lease records nothing"""
+        job = jobs.enqueue('delete_objects', model='core.recipe', ids=[])
+        stale = jobs.claim_next_job()
+        Job.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        current = jobs.claim_next_job()
+
+        jobs.run_job(stale)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        jobs.run_job(current)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIsNone(job.lease_expires_at)
+
+    def test_worker_survives_database_errors(self):
+        """Test a failed claim is logged and retried instead of ending the worker"""
+        recipe = create_recipe(self.user)
+        jobs.enqueue('delete_objects', model='core.recipe', ids=[recipe.id])
+        claim = jobs.claim_next_job
+        err = StringIO()
+
+        with patch(
+            'core.management.commands.run_worker.claim_next_job',
+            side_effect=[OperationalError('server closed the connection'), claim(), None],
+        ):
+            call_command(
+                'run_worker', '--once', '--poll-interval', '0', stdout=StringIO(), stderr=err
+            )
+
+        self.assertIn('Database error, retrying in 0s: server closed the connection', err.getvalue())
+        self.assertFalse(Recipe.objects.filter(pk=recipe.id).exists())
+
+    def test_admin_retry_action(self):
+        """Test the admin queues failed jobs again with fresh attempts"""
+        admin_user = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+        self.client.force_login(admin_user)
+        job = Job.objects.create(
+            name='delete_objects', status=Job.FAILED, attempts=3, error='Boom'
+        )
+
+        res = self.client.post(reverse('admin:core_job_changelist'), {
+            'action': 'retry_selected',
+            '_selected_action': [job.id],
+        })
+
+        self.assertEqual(res.status_code, 302)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.QUEUED, 0, ''))
+
+    def test_delete_objects_in_chunks(self):
+        """Test delete_objects removes the rows and reports progress"""
+        ids = [create_recipe(self.user).id for _ in range(5)]
+        job = jobs.enqueue('delete_objects', model='core.recipe', ids=ids, chunk_size=2)
+
+        run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual((job.progress, job.total), (5, 5))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_merge_attrs(self):
+        """Test merging tags repoints recipes and deletes duplicates"""
+        keep = Tag.objects.create(user=self.user, name='Tomato')
+        dup = Tag.objects.create(user=self.user, name='tomato ')
+        r1 = create_recipe(self.user)
+        r2 = create_recipe(self.user)
+        r1.tags.add(keep, dup)
+        r2.tags.add(dup)
+        jobs.enqueue('merge_attrs', model='core.tag', groups=[[keep.id, dup.id]])
+
+        run_worker()
+
+        self.assertFalse(Tag.objects.filter(pk=dup.id).exists())
+        self.assertEqual(list(r1.tags.all()), [keep])
+        self.assertEqual(list(r2.tags.all()), [keep])
+        keep.refresh_from_db()
+        self.assertEqual(keep.recipe_count, 2)
+
+    def test_reassign_recipes(self):
+        """Test reassigned recipes use the new owner's tags and ingredients"""
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+        existing = Tag.objects.create(user=other, name='Dinner')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        recipe.ingredients.add(Ingredient.objects.create(user=self.user, name='Rice'))
+        jobs.enqueue('reassign_recipes', ids=[recipe.id], user_id=other.id)
+
+        run_worker()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.user, other)
+        self.assertEqual(list(recipe.tags.all()), [existing])
+        self.assertEqual(recipe.ingredients.get().user, other)
+
+    def test_admin_delete_action_enqueues_job(self):
+        """Test the admin bulk delete queues a job instead of deleting"""
+        admin_user = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+        self.client.force_login(admin_user)
+        recipe = create_recipe(self.user)
+
+        res = self.client.post(reverse('admin:core_recipe_changelist'), {
+            'action': 'delete_in_background',
+            '_selected_action': [recipe.id],
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(Recipe.objects.filter(pk=recipe.id).exists())
+        job = Job.objects.get()
+        self.assertEqual(
+            job.payload, {'model': 'core.recipe', 'ids': [recipe.id], 'shard': 'default'}
+        )
+
+    def test_admin_select_all_enqueues_changelist(self):
+        """Test "select all" queues the changelist filters, paged through by the job"""
+        admin_user = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+        self.client.force_login(admin_user)
+        soups = [create_recipe(self.user, title=f'Soup {i}') for i in range(3)]
+        cake = create_recipe(self.user, title='Cake')
+
+        self.client.post(reverse('admin:core_recipe_changelist') + '?q=Soup', {
+            'action': 'delete_in_background',
+            'select_across': '1',
+            '_selected_action': [soups[0].id],
+        })
+        job = Job.objects.get()
+        self.assertEqual(job.payload['changelist'], {
+            'params': {'q': 'Soup'}, 'user_id': admin_user.id, 'max_id': soups[-1].id,
+        })
+        self.assertNotIn('ids', job.payload)
+        job.payload['chunk_size'] = 2
+        job.save()
+        newer = create_recipe(self.user, title='Soup 3')
+
+        run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 3, 3))
+        self.assertEqual(set(Recipe.objects.all()), {cake, newer})
+
+
+class ConcurrentWorkerTests(TransactionTestCase):
+    """Test several worker threads sharing the queue."""
+
+    def test_each_job_runs_once(self):
+        """Test SKIP LOCKED hands every job to exactly one thread"""
+        user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        ids = [create_recipe(user).id for _ in range(6)]
+        for recipe_id in ids:
+            jobs.enqueue('delete_objects', model='core.recipe', ids=[recipe_id])
+
+        call_command('run_worker', '--once', '--concurrency', '3', stdout=StringIO())
+
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(
+            list(Job.objects.values_list('status', 'attempts').distinct()), [(Job.DONE, 1)]
+        )
@@ -3,11 +3,16 @@ Tests for models.
 """
 
 import os
+import re
 from django import setup
 from unittest.mock import patch
 from decimal import Decimal 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
@@ -18,6 +23,10 @@ def create_user(email='user@example.com', password='testpass123'):
     """Creaate and return new user"""
     return get_user_model().objects.create_user(email, password)
 
+def scanned_partitions(plan):
+    """Return the through table partitions a query plan reads."""
+    return set(re.findall(r'core_recipe_(?:tags|ingredients)_p(\d+)', plan))
+
 class ModelTest(TestCase):
     """
     Test models.
@@ -103,4 +112,129 @@ class ModelTest(TestCase):
         mock_uuid.return_value = uuid
         file_path = models.recipe_image_file_path(None, 'example.jpg')
         
-        self.assertEqual(file_path, f"uploads/recipe/{uuid}.jpg")
\ No newline at end of file
+        self.assertEqual(file_path, f"uploads/recipe/{uuid}.jpg")
+        
+    def test_recipe_count_tracks_tags_and_ingredients(self):
+        """Test recipe_count follows adds, removes, clears and deletes."""
+        user = create_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        ing = models.Ingredient.objects.create(user=user, name='Tofu')
+        recipes = [
+            models.Recipe.objects.create(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=Decimal('5.00'),
+            ) for i in range(3)
+        ]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ing)
+        tag.refresh_from_db()
+        ing.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 3)
+        self.assertEqual(ing.recipe_count, 3)
+        
+        recipes[0].tags.remove(tag)
+        recipes[1].ingredients.clear()
+        recipes[2].delete()
+        
+        tag.refresh_from_db()
+        ing.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(ing.recipe_count, 1)
+        
+    def test_ingredients_share_catalog_entry(self):
+        """Test ingredients of the same name point at one catalog entry."""
+        user1 = create_user()
+        user2 = create_user(email='other@example.com')
+        ing1 = models.Ingredient.objects.create(user=user1, name='Salt')
+        ing2 = models.Ingredient.objects.create(user=user2, name='  salt')
+        [ing3] = models.Ingredient.objects.bulk_create(
+            [models.Ingredient(user=user2, name='SALT')]
+        )
+        
+        self.assertEqual(ing1.catalog.key, 'salt')
+        self.assertEqual(ing1.catalog_id, ing2.catalog_id)
+        self.assertEqual(ing1.catalog_id, ing3.catalog_id)
+        self.assertEqual(models.CatalogIngredient.objects.count(), 1)
+        
+        ing1.name = 'Sea Salt'
+        ing1.save()
+        
+        self.assertEqual(ing1.catalog.key, 'sea salt')
+        
+    def test_ingredient_name_served_from_catalog(self):
+        """Test only spellings differing from the catalog name are stored."""
+        user = create_user()
+        models.Ingredient.objects.create(user=user, name='Salt')
+        models.Ingredient.objects.create(user=user, name='SALT')
+        
+        ingredients = models.Ingredient.objects.order_by('pk')
+        
+        self.assertEqual([ing.name for ing in ingredients], ['Salt', 'SALT'])
+        self.assertEqual([ing.spelling for ing in ingredients], [None, 'SALT'])
+        self.assertEqual(ingredients.filter(name='Salt').get().spelling, None)
+        
+    def test_ingredient_save_without_catalog_query(self):
+        """Test saving a loaded ingredient doesn't read its catalog entry."""
+        user = create_user()
+        models.Ingredient.objects.create(user=user, name='Salt')
+        ing = models.Ingredient.objects.get()
+        
+        ing.recipe_count = 3
+        with self.assertNumQueries(1):
+            ing.save()
+        with self.assertNumQueries(1):
+            models.Ingredient(pk=ing.pk, user=user, catalog_id=ing.catalog_id).save(
+                update_fields=['recipe_count']
+            )
+        
+    def test_recipe_through_rows_partition_pruning(self):
+        """Test lookups by recipe only scan that recipe's partition."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=10, price=Decimal('5.00'),
+        )
+        recipe.tags.add(models.Tag.objects.create(user=user, name='Vegan'))
+        
+        for through in [models.RecipeTag, models.RecipeIngredient]:
+            plan = through.objects.filter(recipe=recipe).explain()
+            
+            self.assertEqual(len(scanned_partitions(plan)), 1, plan)
+        self.assertEqual(recipe.tags.get().name, 'Vegan')
+        
+    def test_recipe_list_reads_one_partition_per_recipe(self):
+        """Test the recipe list reads each recipe's tags from its partition.
+        
+        The tags and ingredients filters themselves look rows up by tag or
+        ingredient id, which probes every partition, see migration 0012.
+        """
+        user = create_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        ingredient = models.Ingredient.objects.create(user=user, name='Kale')
+        for title in ['Soup', 'Salad', 'Stew']:
+            recipe = models.Recipe.objects.create(
+                user=user, title=title, time_minutes=10, price=Decimal('5.00'),
+            )
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        client = APIClient()
+        client.force_authenticate(user)
+        
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(reverse('recipe:recipe-list'), {'tags': tag.id})
+        self.assertEqual(len(res.data), 3)
+        
+        reads = [
+            query['sql'] for query in queries
+            if 'core_recipe_tags' in query['sql'] or 'core_recipe_ingredients' in query['sql']
+        ]
+        per_recipe = [sql for sql in reads if re.search(r'\."recipe_id" = \d+', sql)]
+        self.assertEqual(len(per_recipe), 6) #tags and ingredients of 3 recipes
+        for sql in per_recipe:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            self.assertEqual(len(scanned_partitions(plan)), 1, plan)
+
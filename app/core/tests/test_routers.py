@@ -0,0 +1,109 @@
+"""
+Tests for the read replica routing.
+"""
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+from core.routers import read_from_replicas
+
+REPLICAS = ['replica_1', 'replica_2']
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Test reads are routed to the replicas only when it is safe."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def request(self, method, **extra):
+        """Run a request through the middleware, return the read database."""
+        used = []
+
+        def view(request):
+            used.append(router.db_for_read(Recipe))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        middleware(getattr(self.factory, method)('/', **extra))
+        return used[0]
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test management commands and jobs read from the primary"""
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+        with read_from_replicas():
+            self.assertIn(router.db_for_read(Recipe), REPLICAS)
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+
+    def test_safe_request_reads_from_replica(self):
+        """Test a GET reads from one of the replicas"""
+        self.assertIn(self.request('get'), REPLICAS)
+
+    def test_write_request_uses_primary(self):
+        """Test reads made while serving a POST go to the primary"""
+        self.assertEqual(self.request('post'), 'default')
+
+    def test_read_your_writes(self):
+        """Test a client reads from the primary right after a write"""
+        auth = {'HTTP_AUTHORIZATION': 'Token abc'}
+        self.request('patch', **auth)
+
+        self.assertEqual(self.request('get', **auth), 'default')
+        self.assertIn(self.request('get', HTTP_AUTHORIZATION='Token other'), REPLICAS)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test everything uses the primary when no replica is configured"""
+        self.assertEqual(self.request('get'), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        """Test migrate skips the replicas"""
+        self.assertFalse(router.allow_migrate('replica_1', 'core'))
+        self.assertTrue(router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class LaggingReplicaTests(TestCase):
+    """Test a client can use a token the replicas don't have yet."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        #a second connection to the test database doesn't see the rows the
+        #test's open transaction wrote, like a replica that hasn't caught up
+        connections.databases['replica_1'] = dict(connections['default'].settings_dict)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.databases['replica_1']
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_new_token_works_before_replication(self):
+        """Test create user, get a token, then read with it"""
+        payload = {'email': 'new@example.com', 'password': 'testpass123'}
+        res = self.client.post(reverse('user:create'), dict(payload, name='New'))
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        token = self.client.post(reverse('user:token'), payload).data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+        for url in [reverse('recipe:recipe-list'), reverse('user:me')]:
+            res = self.client.get(url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK, url)
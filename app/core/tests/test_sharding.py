@@ -0,0 +1,165 @@
+"""
+Tests for sharding recipe data by user.
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import router
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.jobs import claim_next_job, enqueue, run_job
+from core.models import Ingredient, Job, Recipe, Tag, User, UserShard
+from core.sharding import SHARD_ID_SPAN, hashed_shard, shard_cache_key, use_shard
+
+SHARDS = ['default', 'shard_1']
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardRoutingTests(SimpleTestCase):
+    """Test sharded models are routed to the right shard."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hashed_shard_spreads_users(self):
+        """Test new users are spread evenly and always placed the same"""
+        placed = [hashed_shard(user_id) for user_id in range(1, 1001)]
+
+        self.assertEqual(placed, [hashed_shard(user_id) for user_id in range(1, 1001)])
+        self.assertGreater(placed.count('shard_1'), 400)
+        self.assertGreater(placed.count('default'), 400)
+
+    def test_current_shard(self):
+        """Test queries on sharded models follow use_shard"""
+        with use_shard('shard_1'):
+            self.assertEqual(router.db_for_read(Recipe), 'shard_1')
+            self.assertEqual(router.db_for_write(Tag), 'shard_1')
+            self.assertEqual(router.db_for_read(Recipe.tags.through), 'shard_1')
+            self.assertEqual(router.db_for_read(User), 'default')
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_instance_user_shard(self):
+        """Test a new recipe is saved on its user's shard"""
+        cache.set(shard_cache_key(5), 'shard_1')
+
+        recipe = Recipe(user_id=5, title='Soup', time_minutes=5, price=Decimal('1'))
+
+        self.assertEqual(router.db_for_write(Recipe, instance=recipe), 'shard_1')
+        self.assertEqual(router.db_for_read(Recipe, instance=User(pk=5)), 'shard_1')
+
+    @override_settings(DATABASE_SHARDS=['default'])
+    def test_not_sharded(self):
+        """Test the shard context is ignored without shards"""
+        with use_shard('shard_1'):
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+
+
+@skipUnless('shard_1' in settings.DATABASES, 'set DB_SHARD_HOSTS to run against a shard')
+class MoveUserTests(TestCase):
+    """Test moving a user's recipe data between shards."""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@example.com', password='test123')
+        call_command('move_user', self.user.id, '--to', 'default', stdout=StringIO())
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=Decimal('2.50')
+        )
+        self.recipe.tags.add(tag)
+        self.recipe.ingredients.add(ingredient)
+        self.tag, self.ingredient = tag, ingredient
+
+    def test_move_user(self):
+        """Test the rows are moved and the API reads them from the new shard"""
+        call_command('move_user', self.user.id, '--to', 'shard_1', stdout=StringIO())
+
+        self.assertFalse(Recipe.objects.using('default').filter(user=self.user).exists())
+        moved = Recipe.objects.using('shard_1').get(user=self.user)
+        self.assertEqual(moved.tags.get().name, 'Vegan')
+        self.assertEqual(moved.ingredients.get().recipe_count, 1)
+        self.assertEqual(UserShard.objects.get(user=self.user).alias, 'shard_1')
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.get(reverse('recipe:recipe-list'))
+
+        self.assertEqual([r['title'] for r in res.data], ['Salad'])
+
+    def test_move_keeps_ids(self):
+        """Test moved rows keep the ids clients and cursors refer to"""
+        call_command('move_user', self.user.id, '--to', 'shard_1', stdout=StringIO())
+
+        moved = Recipe.objects.using('shard_1').get(user=self.user)
+        self.assertEqual(moved.id, self.recipe.id)
+        self.assertEqual(list(moved.tags.values_list('id', flat=True)), [self.tag.id])
+        self.assertEqual(
+            list(moved.ingredients.values_list('id', flat=True)), [self.ingredient.id]
+        )
+
+    def test_shards_hand_out_own_ids(self):
+        """Test ids created on a shard don't collide with moved ones"""
+        call_command('move_user', self.user.id, '--to', 'shard_1', stdout=StringIO())
+
+        with use_shard('shard_1'):
+            recipe = Recipe.objects.create(
+                user=self.user, title='Soup', time_minutes=5, price=Decimal('1.00')
+            )
+
+        self.assertGreaterEqual(recipe.id, SHARD_ID_SPAN)
+
+    def test_admin_reads_object_shard(self):
+        """Test the admin edits and deletes rows on their owner's shard"""
+        call_command('move_user', self.user.id, '--to', 'shard_1', stdout=StringIO())
+        admin_user = User.objects.create_superuser('admin@example.com', 'test123')
+        self.client.force_login(admin_user)
+
+        res = self.client.get(reverse('admin:core_recipe_change', args=[self.recipe.id]))
+        self.assertEqual(res.status_code, 200)
+        self.client.post(reverse('admin:core_recipe_changelist') + '?shard=shard_1', {
+            'action': 'delete_in_background',
+            '_selected_action': [self.recipe.id],
+        })
+        run_job(claim_next_job())
+
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertFalse(Recipe.all_objects.using('shard_1').exists())
+
+    def test_reassign_to_other_shard_fails(self):
+        """Test recipes are not handed to a user whose data is elsewhere"""
+        other = User.objects.create_user(email='other@example.com', password='test123')
+        call_command('move_user', other.id, '--to', 'shard_1', stdout=StringIO())
+        enqueue('reassign_recipes', ids=[self.recipe.id], user_id=other.id, shard='default')
+
+        job = claim_next_job()
+        job.max_attempts = 1
+        run_job(job)
+
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.id).user, self.user)
+
+    def test_stub_follows_email_change(self):
+        """Test a freed email can be taken by a user on the same shard"""
+        call_command('move_user', self.user.id, '--to', 'shard_1', stdout=StringIO())
+        self.user.email = 'renamed@example.com'
+        self.user.save()
+        other = User.objects.create_user(email='user@example.com', password='test123')
+        call_command('move_user', other.id, '--to', 'shard_1', stdout=StringIO())
+
+        with use_shard('shard_1'):
+            Tag.objects.create(user=other, name='Keto')
+
+        stubs = User.objects.using('shard_1').filter(pk__in=[self.user.id, other.id])
+        self.assertEqual(
+            dict(stubs.values_list('pk', 'email')),
+            {self.user.id: 'renamed@example.com', other.id: 'user@example.com'},
+        )
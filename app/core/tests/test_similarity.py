@@ -0,0 +1,241 @@
+"""
+Tests for similar recipe recommendations.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core import similarity
+from core.deletion import delete_recipes
+from core.jobs import claim_next_job, enqueue, run_job
+from core.models import Ingredient, Recipe, Tag
+from core.similarity import (
+    SimilarityIndex,
+    change_cache_key,
+    current_version,
+    get_index,
+    invalidate_similarity,
+    similar_from_links,
+    similar_recipes,
+)
+
+
+class SimilarityIndexTests(SimpleTestCase):
+    """Test scoring recipes by their shared tags and ingredients."""
+
+    def setUp(self):
+        self.index = SimilarityIndex([
+            (1, ('tag', 1)), (1, ('tag', 2)),
+            (2, ('tag', 1)), (2, ('tag', 2)),
+            (3, ('tag', 1)), (3, ('ingredient', 1)),
+            (4, ('ingredient', 2)),
+        ])
+
+    def test_jaccard(self):
+        """Test recipes are ranked by shared over combined tags and ingredients"""
+        self.assertEqual(self.index.similar(1), [(2, 1.0), (3, 1 / 3)])
+
+    def test_cosine_ties_go_to_older_recipe(self):
+        """Test cosine scores and ties ordered by recipe id"""
+        self.assertEqual(self.index.similar(3, metric='cosine'), [(1, 0.5), (2, 0.5)])
+
+    def test_top_k(self):
+        """Test only k recipes are returned"""
+        self.assertEqual(self.index.similar(1, k=1), [(2, 1.0)])
+
+    def test_nothing_shared(self):
+        """Test recipes sharing nothing, or without links, have no matches"""
+        self.assertEqual(self.index.similar(4), [])
+        self.assertEqual(self.index.similar(99), [])
+
+    def test_update(self):
+        """Test changed, new and removed recipes and dropped features are applied"""
+        self.index.update({
+            2: {('tag', 1)},
+            4: {('tag', 2)},
+            5: {('tag', 1), ('tag', 2)},
+            3: set(),
+        }, dropped=[('ingredient', 2)])
+
+        self.assertEqual(self.index.similar(1), [(5, 1.0), (2, 0.5), (4, 0.5)])
+        self.assertEqual(self.index.similar(3), [])
+        self.assertEqual(self.index.postings[('tag', 1)].tolist(), [0, 1, 4])
+
+    def test_ties_after_update_go_to_older_recipe(self):
+        """Test an older recipe added by update still wins ties"""
+        self.index.update({0: {('tag', 1), ('tag', 2)}})
+
+        self.assertEqual(self.index.similar(1, k=2), [(0, 1.0), (2, 1.0)])
+
+
+class SimilarRecipesTests(TestCase):
+    """Test the per process index against the database."""
+
+    def setUp(self):
+        cache.clear()
+        similarity._indexes.clear()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=5, price=Decimal('1.00'))
+            for i in range(3)
+        ])
+
+    def test_index_updated_after_changes(self):
+        """Test adding a tag is applied to the cached index once committed"""
+        first, second, third = self.recipes
+        first.tags.add(self.tag)
+        second.tags.add(self.tag)
+        index = get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third.tags.add(self.tag)
+
+        self.assertIs(get_index(self.user.id), index)
+        self.assertEqual(
+            [recipe for recipe, _ in similar_recipes(first)], [second, third]
+        )
+
+    def test_reverse_changes_applied(self):
+        """Test links changed from the tag side and deleted tags are applied"""
+        first, second, third = self.recipes
+        index = get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.recipe_set.add(first, second, third)
+        self.assertEqual(
+            get_index(self.user.id).similar(first.id), [(second.id, 1.0), (third.id, 1.0)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertIs(get_index(self.user.id), index)
+        self.assertEqual(index.similar(first.id), [])
+
+    def test_expired_changes_rebuild(self):
+        """Test an index whose log entries expired is replaced"""
+        first, second, third = self.recipes
+        index = get_index(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.add(self.tag)
+            second.tags.add(self.tag)
+        epoch, seq = current_version(self.user.id)
+
+        cache.delete(change_cache_key(self.user.id, epoch, seq))
+
+        self.assertIsNot(get_index(self.user.id), index)
+        self.assertEqual(get_index(self.user.id).similar(first.id), [(second.id, 1.0)])
+
+    def test_scores_from_links_match_index(self):
+        """Test scoring against the through tables ranks like the index"""
+        first, second, third = self.recipes
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        first.tags.add(self.tag)
+        first.ingredients.add(kale)
+        second.tags.add(self.tag)
+        third.tags.add(self.tag)
+        third.ingredients.add(kale)
+
+        for metric in ('jaccard', 'cosine'):
+            self.assertEqual(
+                similar_from_links(first, metric=metric),
+                get_index(self.user.id).similar(first.id, metric=metric),
+            )
+
+    def test_deleted_recipes_left_out(self):
+        """Test soft deleted recipes are not recommended"""
+        first, second, third = self.recipes
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        Recipe.objects.filter(pk=second.pk).soft_delete()
+
+        self.assertEqual([recipe for recipe, _ in similar_recipes(first)], [third])
+
+    def test_reassigned_recipes_not_recommended(self):
+        """Test recipes moved to another user drop out of the old index"""
+        first, second, third = self.recipes
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        index = get_index(self.user.id)
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('reassign_recipes', ids=[second.id], user_id=other.id)
+            run_job(claim_next_job())
+
+        self.assertIs(get_index(self.user.id), index)
+        self.assertEqual(index.similar(first.id), [(third.id, 1.0)])
+
+    def test_stale_index_stays_within_user(self):
+        """Test an index not yet rebuilt never returns another user's recipe"""
+        first, second, third = self.recipes
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        get_index(self.user.id)
+        other = get_user_model().objects.create_user('other@example.com', 'testpass123')
+
+        Recipe.objects.filter(pk=second.pk).update(user=other) #no invalidation
+
+        self.assertEqual([recipe for recipe, _ in similar_recipes(first)], [third])
+
+    def test_set_based_delete_invalidates(self):
+        """Test core.deletion drops deleted recipes from the index"""
+        first, second, third = self.recipes
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+        index = get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_recipes([second.id])
+
+        self.assertIs(get_index(self.user.id), index)
+        self.assertEqual(index.similar(first.id), [(third.id, 1.0)])
+
+
+class BackgroundBuildTests(TransactionTestCase):
+    """Test indexes are built off the request path."""
+
+    def setUp(self):
+        cache.clear()
+        similarity._indexes.clear()
+        self.user = get_user_model().objects.create_user('user@example.com', 'testpass123')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=5, price=Decimal('1.00'))
+            for i in range(3)
+        ])
+        for recipe in self.recipes[:2]:
+            recipe.tags.add(tag)
+
+    def wait_for_build(self):
+        """Wait for the background build of the user's index to finish."""
+        thread = similarity._building.get(self.user.id)
+        if thread is not None:
+            thread.join()
+
+    def test_cold_lookup_answers_from_links(self):
+        """Test a process without the index answers while building it"""
+        first, second, third = self.recipes
+
+        self.assertEqual([recipe for recipe, _ in similar_recipes(first)], [second])
+        self.wait_for_build()
+
+        self.assertEqual(get_index(self.user.id).similar(first.id), [(second.id, 1.0)])
+
+    def test_stale_index_served_while_rebuilding(self):
+        """Test a stale index answers until its replacement is built"""
+        first, second, third = self.recipes
+        get_index(self.user.id)
+        self.wait_for_build()
+        index = get_index(self.user.id)
+        third.tags.add(Tag.objects.get())
+        invalidate_similarity(self.user.id)
+
+        self.assertIs(get_index(self.user.id), index)
+        self.wait_for_build()
+
+        rebuilt = get_index(self.user.id)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.similar(first.id), [(second.id, 1.0), (third.id, 1.0)])
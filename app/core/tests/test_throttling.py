@@ -0,0 +1,92 @@
+"""
+Tests for the token bucket throttles.
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+
+from rest_framework.test import APIRequestFactory
+
+from core.throttling import AnonTokenBucketThrottle
+
+
+class FixedRateThrottle(AnonTokenBucketThrottle):
+    """Throttle with a fixed rate for the tests."""
+    scope = 'test'
+    THROTTLE_RATES = {'test': '3/min'}
+
+
+class TokenBucketThrottleTests(SimpleTestCase):
+    """Test the token bucket throttle."""
+
+    def setUp(self):
+        cache.clear()
+        self.request = APIRequestFactory().get('/')
+        self.request.user = AnonymousUser()
+        self.now = 1000.0
+
+    def check(self):
+        """Run a throttle check at the current fake time."""
+        throttle = FixedRateThrottle()
+        throttle.timer = lambda: self.now
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_allows_burst_up_to_rate(self):
+        """Test a full bucket allows num_requests then throttles"""
+        results = [self.check()[0] for _ in range(4)]
+
+        self.assertEqual(results, [True, True, True, False])
+
+    def test_wait_reports_time_to_next_token(self):
+        """Test wait() is the time until one token has refilled"""
+        for _ in range(3):
+            self.check()
+
+        allowed, throttle = self.check()
+
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20.0)
+
+    def test_bucket_refills_over_time(self):
+        """Test tokens come back at num_requests per duration"""
+        for _ in range(3):
+            self.check()
+
+        self.now += 20
+        self.assertTrue(self.check()[0])
+        self.assertFalse(self.check()[0])
+
+    @patch('django.db.backends.utils.CursorWrapper.execute')
+    def test_check_does_not_touch_database(self, patched_execute):
+        """Test a throttle check only uses the cache"""
+        self.check()
+
+        patched_execute.assert_not_called()
+
+    def test_concurrent_checks_do_not_overshoot(self):
+        """Test checks racing on one bucket allow no more than the rate"""
+        get = LocMemCache.get
+
+        def slow_get(*args, **kwargs):
+            value = get(*args, **kwargs)
+            time.sleep(0.01) #widen the window between read and write
+            return value
+
+        results = []
+        with patch.object(LocMemCache, 'get', slow_get):
+            threads = [
+                threading.Thread(target=lambda: results.append(self.check()[0]))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results.count(True), 3)
@@ -0,0 +1,75 @@
+"""
+Token bucket throttles for the APIs.
+
+Bucket state lives in the default cache (shared uwsgi memory in production),
+so a throttle check never touches the database.
+"""
+
+from contextlib import nullcontext
+
+from rest_framework.throttling import (
+    AnonRateThrottle,
+    SimpleRateThrottle,
+    UserRateThrottle,
+)
+
+
+class TokenBucketMixin:
+    """Replace SimpleRateThrottle's request history with a token bucket.
+
+    The bucket holds up to num_requests tokens and refills at
+    num_requests per duration, so bursts are allowed up to the rate.
+    Each check is a cache get and set of a (tokens, timestamp) pair, done
+    under the cache's lock so concurrent workers can't spend the same token.
+    A cache without lock() is updated unlocked and may overshoot the rate.
+    """
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        lock = getattr(self.cache, 'lock', nullcontext)
+        with lock():
+            self.now = self.timer()
+            capacity = self.num_requests
+            refill_rate = self.num_requests / self.duration
+            tokens, stamp = self.cache.get(self.key, (capacity, self.now))
+            tokens = min(capacity, tokens + (self.now - stamp) * refill_rate)
+
+            if tokens < 1:
+                self.wait_seconds = (1 - tokens) / refill_rate
+                return False
+
+            self.cache.set(self.key, (tokens - 1, self.now), self.duration)
+            return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonTokenBucketThrottle(TokenBucketMixin, AnonRateThrottle):
+    """Throttle anonymous requests per IP address."""
+
+
+class UserTokenBucketThrottle(TokenBucketMixin, UserRateThrottle):
+    """Throttle authenticated requests per user."""
+
+
+class LoginTokenBucketThrottle(TokenBucketMixin, SimpleRateThrottle):
+    """Throttle token requests per IP address with the stricter login rate.
+
+    Keyed by IP even for authenticated requests, valid credentials for one
+    account must not lift the limit on guessing another's.
+    """
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
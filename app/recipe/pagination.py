@@ -0,0 +1,16 @@
+"""
+Pagination for the recipe APIs.
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Opt-in cursor pagination, enabled by passing ?page_size=."""
+    page_size = None #no page_size param means the plain unpaginated list
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    
+    def get_ordering(self, request, queryset, view):
+        """Follow the ordering the view applied to the queryset."""
+        return view.get_ordering()
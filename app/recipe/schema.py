@@ -0,0 +1,176 @@
+"""
+OpenAPI annotations for the recipe APIs.
+
+drf_spectacular is only imported while generating a schema, so the
+annotations are applied through view extensions instead of decorators on
+recipe.views. app.schema_generator.SchemaGenerator imports this module.
+"""
+
+from drf_spectacular.extensions import OpenApiViewExtension
+from drf_spectacular.utils import (
+    extend_schema_view,
+    extend_schema,
+    OpenApiParameter,
+    OpenApiTypes
+)
+
+from recipe.serializers import (
+    RecipeBatchResultSerializer,
+    RecipeBatchSerializer,
+    RecipeDetailSerializer,
+    RecipeDuplicateSerializer,
+    ShoppingListSerializer,
+    SimilarRecipeSerializer,
+)
+
+
+class RecipeAttrViewSchema(OpenApiViewExtension):
+    """Document the tag and ingredient list filters."""
+    target_class = 'recipe.views.BaseRecipeAttrViewSet'
+    match_subclasses = True
+    
+    def view_replacement(self):
+        @extend_schema_view(
+            list=extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        'assigned_only',
+                        OpenApiTypes.INT, enum=[0,1],
+                        description='Filter by items assigned to recipes.'
+                    )
+                ]
+            )
+        )
+        class Fixed(self.target):
+            @extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        'prefix',
+                        OpenApiTypes.STR,
+                        description='Case insensitive name prefix to complete.'
+                    )
+                ]
+            )
+            def autocomplete(self, request, *args, **kwargs):
+                return super().autocomplete(request, *args, **kwargs)
+            
+        return Fixed
+    
+    
+class RecipeViewSchema(OpenApiViewExtension):
+    """Document the recipe list filters and actions."""
+    target_class = 'recipe.views.RecipeViewSet'
+    
+    def view_replacement(self):
+        @extend_schema_view(
+            list=extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        'tags',
+                        OpenApiTypes.STR,
+                        description='Coma seperated list of tag IDs to filter'
+                    ),
+                    OpenApiParameter(
+                        'ingredients',
+                        OpenApiTypes.STR,
+                        description='Coma seperated list of ingredients IDs to filter'
+                    ),
+                    OpenApiParameter(
+                        'pantry',
+                        OpenApiTypes.STR,
+                        description='Comma separated list of ingredient IDs on hand. Only recipes '
+                                    'using at least one are listed, fewest missing ingredients first.'
+                    ),
+                    OpenApiParameter(
+                        'min_price',
+                        OpenApiTypes.DECIMAL,
+                        description='Only recipes costing at least this much.'
+                    ),
+                    OpenApiParameter(
+                        'max_price',
+                        OpenApiTypes.DECIMAL,
+                        description='Only recipes costing at most this much.'
+                    ),
+                    OpenApiParameter(
+                        'max_time',
+                        OpenApiTypes.INT,
+                        description='Only recipes taking at most this many minutes.'
+                    ),
+                    OpenApiParameter(
+                        'ordering',
+                        OpenApiTypes.STR,
+                        enum=['price', '-price', 'time_minutes', '-time_minutes'],
+                        description='Sort recipes by price or time, newest first by default '
+                                    '(best pantry coverage first with pantry).'
+                    ),
+                ]
+            )
+        )
+        class Fixed(self.target):
+            @extend_schema(
+                methods=['GET'],
+                parameters=[
+                    OpenApiParameter(
+                        'ids',
+                        OpenApiTypes.STR,
+                        description='Comma separated list of up to 500 recipe IDs.'
+                    )
+                ],
+                request=None,
+                responses=RecipeBatchResultSerializer,
+            )
+            @extend_schema(
+                methods=['POST'],
+                request=RecipeBatchSerializer,
+                responses=RecipeBatchResultSerializer,
+            )
+            def batch(self, request, *args, **kwargs):
+                return super().batch(request, *args, **kwargs)
+            
+            @extend_schema(
+                methods=['GET'],
+                parameters=[
+                    OpenApiParameter(
+                        'ids',
+                        OpenApiTypes.STR,
+                        description='Comma separated list of up to 500 recipe IDs.'
+                    )
+                ],
+                request=None,
+                responses=ShoppingListSerializer,
+            )
+            @extend_schema(
+                methods=['POST'],
+                request=RecipeBatchSerializer,
+                responses=ShoppingListSerializer,
+            )
+            def shopping_list(self, request, *args, **kwargs):
+                return super().shopping_list(request, *args, **kwargs)
+            
+            @extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        'k',
+                        OpenApiTypes.INT,
+                        description='How many recipes to return, 10 by default and at most 50.'
+                    ),
+                    OpenApiParameter(
+                        'metric',
+                        OpenApiTypes.STR,
+                        enum=['jaccard', 'cosine'],
+                        description='Similarity of the tag and ingredient sets, jaccard by default.'
+                    ),
+                ],
+                responses=SimilarRecipeSerializer(many=True),
+            )
+            def similar(self, request, *args, **kwargs):
+                return super().similar(request, *args, **kwargs)
+            
+            @extend_schema(
+                request=RecipeDuplicateSerializer,
+                responses={201: RecipeDetailSerializer},
+            )
+            def duplicate(self, request, *args, **kwargs):
+                return super().duplicate(request, *args, **kwargs)
+        
+        return Fixed
@@ -4,7 +4,7 @@ Serializers for recipe APIs
 
 from rest_framework import serializers
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import Recipe, Tag, Ingredient, normalize_attr_name
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -15,14 +15,23 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
         
+    def validate_name(self, value):
+        """Store names in their canonical form."""
+        return normalize_attr_name(value)
+        
    
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer for ingredients."""
+    name = serializers.CharField(max_length=255) #a property, served from the catalog
     
     class Meta:
         model = Ingredient
         fields = ['id', 'name']
         read_only_fields = ['id']     
+        
+    def validate_name(self, value):
+        """Store names in their canonical form."""
+        return normalize_attr_name(value)
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializers for recipes."""
@@ -42,9 +51,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Handle getting or creating tags as needed"""
         auth_user = self.context['request'].user #authenticated user from the request
         for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create( #helper method if it exists itll just get, if it doesnt it will create
-                user=auth_user,
-                **tag #grabs all key/value pairs for tag 
+            tag_obj = Tag.objects.get_or_create_by_name( #case insensitive, so "dinner" reuses "Dinner"
+                auth_user,
+                tag['name']
             )
             recipe.tags.add(tag_obj)
      
@@ -53,9 +62,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Handle getting or creating ingredients as needed"""
         auth_user = self.context['request'].user #authenticated user from the request
         for ing in ings:
-            ing_obj, created = Ingredient.objects.get_or_create( #helper method if it exists itll just get, if it doesnt it will create
-                user=auth_user,
-                **ing #grabs all key/value pairs for ingredient 
+            ing_obj = Ingredient.objects.get_or_create_by_name( #case insensitive, so "tomato" reuses "Tomato"
+                auth_user,
+                ing['name']
             )
             recipe.ingredients.add(ing_obj)
             
@@ -98,6 +107,59 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
         
         
+class PantryRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe and how much of it a pantry covers."""
+    missing_ingredients = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+    
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['missing_ingredients', 'coverage']
+        
+        
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe and how similar it is to another one."""
+    similarity = serializers.FloatField(read_only=True)
+    
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+        
+        
+class RecipeDuplicateSerializer(serializers.Serializer):
+    """Serializer for the fields to change when duplicating a recipe."""
+    title = serializers.CharField(max_length=255, required=False)
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Serializer for the recipe IDs to fetch in one batch."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500,
+    )
+
+
+class RecipeBatchResultSerializer(serializers.Serializer):
+    """Serializer for a batch of recipes and the IDs that were not found."""
+    results = RecipeDetailSerializer(many=True)
+    missing = serializers.ListField(child=serializers.IntegerField())
+
+
+class ShoppingListIngredientSerializer(serializers.Serializer):
+    """Serializer for an ingredient and how many planned recipes use it."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField(source='plan_recipes')
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Serializer for the merged ingredients and totals of many recipes."""
+    recipes = serializers.IntegerField()
+    missing = serializers.ListField(child=serializers.IntegerField())
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_time_minutes = serializers.IntegerField()
+    ingredients = ShoppingListIngredientSerializer(many=True)
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading imgages to recipes."""
     
@@ -22,6 +22,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 
 def create_user(email='user@example.com', password='testpass123'):
@@ -153,4 +154,25 @@ class PrivateIngredientAPITest(TestCase):
         
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
         
-        self.assertEqual(len(res.data),1)
\ No newline at end of file
+        self.assertEqual(len(res.data),1)
+        
+    def test_autocomplete_ingredients(self):
+        """Test autocomplete matches a prefix and orders by popularity."""
+        tomato = Ingredient.objects.create(user=self.user, name='Tomato')
+        paste = Ingredient.objects.create(user=self.user, name='tomato paste')
+        Ingredient.objects.create(user=self.user, name='Basil')
+        other_user = create_user(email='other@example.com')
+        Ingredient.objects.create(user=other_user, name='Tomatillo')
+        for title in ['Sauce', 'Soup']:
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=10,
+                price=Decimal('2.00'),
+                user=self.user
+            )
+            recipe.ingredients.add(paste)
+        
+        res = self.client.get(AUTOCOMPLETE_URL, {'prefix': 'TOM'})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([i['id'] for i in res.data], [paste.id, tomato.id])
@@ -11,7 +11,9 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -27,6 +29,8 @@ from recipe.serializers import (
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BATCH_URL = reverse('recipe:recipe-batch')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
 
 #instead of just having a value as the url endpoint we need to be able to pass in the id
 #to the endpoint so thats why we make a function for this endpoint.
@@ -38,6 +42,14 @@ def image_upload_url(recipe_id):
     """Create and return an image upload URL."""
     return reverse('recipe:recipe-upload-image', args=[recipe_id]) #will call upon the upload_image function we made in our models
 
+def duplicate_url(recipe_id):
+    """Create and return a recipe duplicate URL."""
+    return reverse('recipe:recipe-duplicate', args=[recipe_id])
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
 def create_recipe(user, **params):
     """Create and return a sample recipe."""
     defaults = {
@@ -178,6 +190,224 @@ class PrivateRecipeAPITests(TestCase):
             self.assertEqual(getattr(recipe, k), v)
         self.assertEqual(recipe.user, self.user)
         
+    def test_delete_recipe(self):
+        """Test deleting a recipe hides it and releases its tags."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        
+        res = self.client.delete(detail_url(recipe.id))
+        
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        self.assertIsNotNone(Recipe.all_objects.get(id=recipe.id).deleted_at) #purged later
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+        self.assertEqual(self.client.get(detail_url(recipe.id)).status_code, status.HTTP_404_NOT_FOUND)
+        
+    def test_delete_other_users_recipe_error(self):
+        """Test trying to delete another users recipe gives error."""
+        other = create_user(email='other@example.com', password='testpass123')
+        recipe = create_recipe(user=other)
+        
+        res = self.client.delete(detail_url(recipe.id))
+        
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+        
+    def test_batch_retrieve(self):
+        """Test fetching recipes by id in the requested order."""
+        r1 = create_recipe(user=self.user, title='First')
+        r2 = create_recipe(user=self.user, title='Second')
+        other = create_recipe(user=create_user(email='other@example.com', password='testpass123'))
+        
+        res = self.client.get(BATCH_URL, {'ids': f'{r2.id},{other.id},{r1.id},999999'})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], RecipeDetailSerializer([r2, r1], many=True).data)
+        self.assertEqual(res.data['missing'], [other.id, 999999]) #foreign ids look missing
+        
+    def test_batch_retrieve_post(self):
+        """Test long id lists can be sent in the body."""
+        recipes = [create_recipe(user=self.user, title=f'Recipe {i}') for i in range(3)]
+        
+        res = self.client.post(BATCH_URL, {'ids': [r.id for r in recipes]}, format='json')
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [r.id for r in recipes])
+        self.assertEqual(res.data['missing'], [])
+        
+    def test_batch_retrieve_query_count(self):
+        """Test the batch costs the same queries however many recipes it returns."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        recipes = [create_recipe(user=self.user) for i in range(10)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+            
+        with CaptureQueriesContext(connection) as few_queries:
+            self.client.get(BATCH_URL, {'ids': str(recipes[0].id)})
+        with CaptureQueriesContext(connection) as many_queries:
+            self.client.get(BATCH_URL, {'ids': ','.join(str(r.id) for r in recipes)})
+            
+        self.assertEqual(len(few_queries), len(many_queries))
+        
+    def test_batch_retrieve_invalid_ids(self):
+        """Test bad or too many ids are rejected."""
+        res = self.client.get(BATCH_URL, {'ids': '1,abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        res = self.client.post(BATCH_URL, {'ids': list(range(1, 502))}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_filter_by_pantry(self):
+        """Test ranking recipes by how many of their ingredients are on hand."""
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        cookable = create_recipe(user=self.user, title='Cookable')
+        half = create_recipe(user=self.user, title='Half')
+        third = create_recipe(user=self.user, title='Third')
+        none = create_recipe(user=self.user, title='None')
+        cookable.ingredients.add(kale, rice)
+        half.ingredients.add(kale, tofu)
+        third.ingredients.add(rice, tofu, salt)
+        none.ingredients.add(salt)
+        
+        res = self.client.get(RECIPES_URL, {'pantry': f'{kale.id},{rice.id}'})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['title'], r['missing_ingredients']) for r in res.data],
+            [('Cookable', 0), ('Half', 1), ('Third', 2)]
+        )
+        self.assertEqual(res.data[1]['coverage'], 0.5)
+        
+        #the ingredients filter joins the same table, counts must not shrink
+        res = self.client.get(RECIPES_URL, {'pantry': str(kale.id), 'ingredients': str(tofu.id)})
+        
+        self.assertEqual([(r['title'], r['missing_ingredients']) for r in res.data], [('Half', 1)])
+        
+    def test_shopping_list(self):
+        """Test merging the ingredients and totals of several recipes."""
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        r1 = create_recipe(user=self.user, price=Decimal('5.25'), time_minutes=20)
+        r2 = create_recipe(user=self.user, price=Decimal('2.50'), time_minutes=10)
+        other = create_recipe(user=create_user(email='other@example.com', password='testpass123'))
+        r1.ingredients.add(kale, rice)
+        r2.ingredients.add(rice)
+        
+        res = self.client.post(
+            SHOPPING_LIST_URL, {'ids': [r1.id, r2.id, r1.id, other.id]}, format='json'
+        )
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipes'], 2)
+        self.assertEqual(res.data['missing'], [other.id])
+        self.assertEqual(res.data['total_price'], '7.75')
+        self.assertEqual(res.data['total_time_minutes'], 30)
+        self.assertEqual(res.data['ingredients'], [
+            {'id': kale.id, 'name': 'Kale', 'recipe_count': 1},
+            {'id': rice.id, 'name': 'Rice', 'recipe_count': 2},
+        ])
+        
+    def test_shopping_list_query_count(self):
+        """Test the shopping list costs the same queries for more recipes."""
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        recipes = [create_recipe(user=self.user) for i in range(10)]
+        for recipe in recipes:
+            recipe.ingredients.add(kale)
+            
+        with CaptureQueriesContext(connection) as few_queries:
+            self.client.get(SHOPPING_LIST_URL, {'ids': str(recipes[0].id)})
+        with CaptureQueriesContext(connection) as many_queries:
+            res = self.client.get(SHOPPING_LIST_URL, {'ids': ','.join(str(r.id) for r in recipes)})
+            
+        self.assertEqual(len(few_queries), len(many_queries))
+        self.assertEqual(res.data['ingredients'][0]['recipe_count'], 10)
+        
+    def test_similar_recipes(self):
+        """Test listing recipes sharing tags and ingredients, most similar first."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        kale = Ingredient.objects.create(user=self.user, name='Kale')
+        recipe = create_recipe(user=self.user)
+        close = create_recipe(user=self.user, title='Close')
+        far = create_recipe(user=self.user, title='Far')
+        create_recipe(user=self.user, title='Unrelated')
+        recipe.tags.add(vegan, quick)
+        recipe.ingredients.add(kale)
+        close.tags.add(vegan, quick)
+        far.ingredients.add(kale)
+        
+        res = self.client.get(similar_url(recipe.id))
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['title'] for r in res.data], ['Close', 'Far'])
+        self.assertEqual([r['similarity'] for r in res.data], [0.6667, 0.3333])
+        
+        res = self.client.get(similar_url(recipe.id), {'k': 1, 'metric': 'cosine'})
+        
+        self.assertEqual([r['title'] for r in res.data], ['Close'])
+        
+    def test_similar_recipes_invalid_params(self):
+        """Test bad k or metric values are rejected."""
+        recipe = create_recipe(user=self.user)
+        
+        for params in [{'k': 0}, {'k': 51}, {'k': 'abc'}, {'metric': 'euclid'}]:
+            res = self.client.get(similar_url(recipe.id), params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            
+    def test_duplicate_recipe(self):
+        """Test duplicating a recipe copies its links and shares its image."""
+        recipe = create_recipe(user=self.user, image='uploads/recipe/soup.jpg')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        
+        res = self.client.post(duplicate_url(recipe.id), {'title': 'Soup again'}, format='json')
+        
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['id'])
+        self.assertNotEqual(copy.id, recipe.id)
+        self.assertEqual(copy.title, 'Soup again')
+        self.assertEqual(copy.user, self.user)
+        self.assertEqual(copy.image.name, recipe.image.name) #no bytes copied
+        self.assertEqual(list(copy.tags.all()), [tag])
+        self.assertEqual(list(copy.ingredients.all()), [ingredient])
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+        self.assertEqual(ingredient.recipe_count, 2)
+        
+    def test_duplicate_recipe_query_count(self):
+        """Test duplicating costs the same queries however many tags there are."""
+        few = create_recipe(user=self.user)
+        many = create_recipe(user=self.user)
+        few.tags.add(Tag.objects.create(user=self.user, name='Tag 0'))
+        many.tags.add(*[Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(1, 20)])
+        
+        with CaptureQueriesContext(connection) as few_queries:
+            self.client.post(duplicate_url(few.id))
+        with CaptureQueriesContext(connection) as many_queries:
+            self.client.post(duplicate_url(many.id))
+            
+        self.assertEqual(len(few_queries), len(many_queries))
+        
+    def test_duplicate_other_users_recipe_error(self):
+        """Test duplicating another users recipe gives error."""
+        other = create_user(email='other@example.com', password='testpass123')
+        recipe = create_recipe(user=other)
+        
+        res = self.client.post(duplicate_url(recipe.id))
+        
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Recipe.objects.count(), 1)
+        
     def test_create_recipe_with_new_tags(self):
         """Test creating a recipe with new tags."""
         payload = {
@@ -399,6 +629,73 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
         
+    def test_filter_by_price_and_time(self):
+        """Test filtering recipes by price range and maximum time."""
+        r1 = create_recipe(user=self.user, price=Decimal('4.00'), time_minutes=20)
+        r2 = create_recipe(user=self.user, price=Decimal('8.00'), time_minutes=25)
+        r3 = create_recipe(user=self.user, price=Decimal('12.00'), time_minutes=20)
+        r4 = create_recipe(user=self.user, price=Decimal('8.00'), time_minutes=90)
+        
+        params = {'min_price': '5', 'max_price': '10', 'max_time': 30}
+        res = self.client.get(RECIPES_URL, params)
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [r['id'] for r in res.data]
+        self.assertEqual(ids, [r2.id])
+        self.assertNotIn(r1.id, ids)
+        self.assertNotIn(r3.id, ids)
+        self.assertNotIn(r4.id, ids)
+        
+    def test_invalid_price_filter(self):
+        """Test a non numeric price filter returns a 400."""
+        res = self.client.get(RECIPES_URL, {'max_price': 'cheap'})
+        
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_order_by_price(self):
+        """Test ordering recipes cheapest first."""
+        r1 = create_recipe(user=self.user, price=Decimal('9.00'))
+        r2 = create_recipe(user=self.user, price=Decimal('3.00'))
+        r3 = create_recipe(user=self.user, price=Decimal('6.00'))
+        
+        res = self.client.get(RECIPES_URL, {'ordering': 'price'})
+        
+        self.assertEqual([r['id'] for r in res.data], [r2.id, r3.id, r1.id])
+        
+    def test_cursor_pagination_with_ordering(self):
+        """Test paging through recipes ordered by time with a cursor."""
+        recipes = [
+            create_recipe(user=self.user, time_minutes=minutes)
+            for minutes in [50, 10, 40, 20, 30]
+        ]
+        expected = [r.id for r in sorted(recipes, key=lambda r: r.time_minutes)]
+        
+        res = self.client.get(RECIPES_URL, {'ordering': 'time_minutes', 'page_size': 2})
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [r['id'] for r in res.data['results']]
+        
+        self.assertEqual(ids, expected)
+        
+    def test_tags_matched_case_insensitively(self):
+        """Test tag names are normalized and reuse existing tags."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        payload = {
+            'title': 'Steak',
+            'time_minutes': 30,
+            'price': Decimal('12.00'),
+            'tags': [{'name': '  dinner '}, {'name': 'Date   Night'}]
+        }
+        
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertIn(tag, recipe.tags.all())
+        self.assertTrue(recipe.tags.filter(name='Date Night').exists())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        
         
 class ImageUploadtests(TestCase):
     """Tests for the image upload API."""
@@ -437,4 +734,4 @@ class ImageUploadtests(TestCase):
         payload = {'image': 'notanimage.jpg'}
         res = self.client.post(url, payload, format='multipart')
         
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,88 @@
+"""
+Tests for the OpenAPI schema.
+"""
+import gzip
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from app.schema import clear_schema_cache, schema_path
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaTests(TestCase):
+    """Test the generated schema documents the recipe APIs."""
+
+    def setUp(self):
+        self.schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.schema_dir.cleanup)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        clear_schema_cache()
+        self.addCleanup(clear_schema_cache)
+
+    def test_schema_includes_view_annotations(self):
+        """Test the annotations from recipe.schema reach the schema."""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        content = res.content.decode()
+        for param in ['assigned_only', 'prefix', 'min_price', 'ordering']:
+            self.assertIn(param, content)
+
+    def test_schema_etag_not_modified(self):
+        """Test a matching If-None-Match gets a 304 without a body."""
+        res = self.client.get(SCHEMA_URL)
+        etag = res['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_schema_gzipped(self):
+        """Test the schema is served gzipped to clients that accept it."""
+        plain = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_schema_json_format(self):
+        """Test the JSON rendering is selected with ?format=json."""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi+json')
+        self.assertIn('/api/recipe/recipes/', res.json()['paths'])
+
+    def test_schema_served_from_build(self):
+        """Test the file written by build_schema is what gets served."""
+        call_command('build_schema', stdout=StringIO())
+        with open(schema_path('yaml'), 'ab') as f:
+            f.write(b'# built\n')
+
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertTrue(res.content.endswith(b'# built\n'))
+
+    def test_build_schema_check(self):
+        """Test build_schema --check fails until the schema is rebuilt."""
+        with self.assertRaises(CommandError):
+            call_command('build_schema', '--check')
+
+        call_command('build_schema', stdout=StringIO())
+        call_command('build_schema', '--check', stdout=StringIO())
+
+        with open(schema_path('json'), 'wb') as f:
+            f.write(b'{}')
+        with self.assertRaisesRegex(CommandError, 'out of date'):
+            call_command('build_schema', '--check')
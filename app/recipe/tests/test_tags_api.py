@@ -7,6 +7,8 @@ from django import setup
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -19,6 +21,7 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 def detail_url(tag_id):
     """Create a unique and return a tag detail url"""
@@ -147,4 +150,33 @@ class PrivateTagsAPITest(TestCase):
         
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         
-        self.assertEqual(len(res.data),1)
\ No newline at end of file
+        self.assertEqual(len(res.data),1)
+        
+    def test_autocomplete_tags(self):
+        """Test autocomplete matches a prefix and orders by popularity."""
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Steak',
+            time_minutes=30,
+            price='12.00',
+            user=self.user
+        )
+        recipe.tags.add(dinner)
+        
+        res = self.client.get(AUTOCOMPLETE_URL, {'prefix': 'd'})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['id'] for t in res.data], [dinner.id, dessert.id])
+        
+    def test_assigned_only_uses_exists(self):
+        """Test assigned_only is a semi-join rather than join + DISTINCT."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        sql = ctx.captured_queries[-1]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
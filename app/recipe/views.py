@@ -2,39 +2,37 @@
 Views for the recipe APIs.
 """
 
-from drf_spectacular.utils import (
-    extend_schema_view,
-    extend_schema,
-    OpenApiParameter,
-    OpenApiTypes
-)
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Count, Sum
+from django.db.models.functions import Lower
+
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response 
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import PrimaryFallbackTokenAuthentication
 from core.models import Recipe, Tag, Ingredient
+from core.sharding import ShardRoutingMixin
+from core.similarity import record_change, similar_recipes
 from recipe import serializers 
+from recipe.pagination import RecipeCursorPagination
 
-@extend_schema_view(
-    list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'assigned_only',
-                OpenApiTypes.INT, enum=[0,1],
-                description='Filter by items assigned to recipes.'
-            )
-        ]
-    )
-)
-class BaseRecipeAttrViewSet(mixins.UpdateModelMixin, 
+
+# OpenAPI annotations for these views live in recipe.schema, so serving
+# requests never imports drf_spectacular.
+class BaseRecipeAttrViewSet(ShardRoutingMixin,
+                mixins.UpdateModelMixin, 
                 mixins.DestroyModelMixin,
                 viewsets.GenericViewSet,
                 mixins.ListModelMixin):
     """Base Viewset for recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [PrimaryFallbackTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    autocomplete_limit = 10
     
     def get_queryset(self):
         """Filter querset to authenticated user."""
@@ -43,9 +41,25 @@ class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.assigned() #EXISTS semi-join, no join + DISTINCT over the through table
             
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+        return queryset.filter(user=self.request.user).order_by('-name')
+    
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """List items starting with a prefix, most used first."""
+        prefix = request.query_params.get('prefix', '').strip().lower()
+        queryset = self.queryset.filter(user=request.user)
+        if prefix:
+            #compare against lower(name) so the (user, lower(name)) index is used,
+            #ingredient names come from the catalog and scan the user's rows
+            queryset = queryset.annotate(
+                name_lower=Lower('name')
+            ).filter(name_lower__startswith=prefix)
+        queryset = queryset.order_by('-recipe_count', 'name')[:self.autocomplete_limit]
+        serializer = self.get_serializer(queryset, many=True)
+        
+        return Response(serializer.data)
     
     
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -61,64 +75,194 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     queryset = Ingredient.objects.all()
     
     
-@extend_schema_view(
-    list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Coma seperated list of tag IDs to filter'
-            ),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Coma seperated list of ingredients IDs to filter'
-            ),
-        ]
-    )
-)
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardRoutingMixin, viewsets.ModelViewSet):
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [PrimaryFallbackTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    ordering_fields = ['price', 'time_minutes']
+    similarity_metrics = ['jaccard', 'cosine']
+    similar_limit = 50
     
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers."""
         return [int(str_id) for str_id in qs.split(',')]
     
+    def _param_to_number(self, name, convert):
+        """Convert a single query param with convert, None when it is missing."""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            number = convert(value)
+        except (ValueError, InvalidOperation):
+            number = None
+        if number is None or not Decimal(number).is_finite():
+            raise ValidationError({name: 'A valid number is required.'})
+        return number
+    
+    def get_ordering(self):
+        """Return the requested ordering, with id as the tie breaker."""
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering.lstrip('-') in self.ordering_fields:
+            return (ordering, '-id')
+        if self.request.query_params.get('pantry'):
+            return ('missing_ingredients', '-coverage', '-id')
+        return ('-id',)
+    
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        pantry = self.request.query_params.get('pantry')
+        min_price = self._param_to_number('min_price', Decimal)
+        max_price = self._param_to_number('max_price', Decimal)
+        max_time = self._param_to_number('max_time', int)
         queryset = self.queryset
+        if pantry:
+            #before the filters below so their joins don't narrow the counts
+            queryset = queryset.rank_by_pantry(self._params_to_ints(pantry))
         if tags:
             tag_ids = self._params_to_ints(tags)
             queryset = queryset.filter(tags__id__in=tag_ids) #django filtering built in to bring back only recipes that have tags
         if ingredients:
             ings_ids = self._params_to_ints(ingredients) #django filtering buitl in to bring back only recipes with ingredients
             queryset = queryset.filter(ingredients__id__in=ings_ids)
+        #range filters are served by the (user, price) and (user, time_minutes) indexes
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if max_time is not None:
+            queryset = queryset.filter(time_minutes__lte=max_time)
             
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by(*self.get_ordering()).distinct()
             
     
     def get_serializer_class(self):
         """Return the serializer class for request."""
         if self.action == 'list': #calling the HTTP GET request to this endpoint it will be a 'list' action
+            if self.request.query_params.get('pantry'):
+                return serializers.PantryRecipeSerializer
             return serializers.RecipeSerializer 
         if self.action =='upload_image':
             return serializers.RecipeImageSerializer
+        if self.action == 'duplicate':
+            return serializers.RecipeDuplicateSerializer
+        if self.action in ('batch', 'shopping_list'):
+            return serializers.RecipeBatchSerializer
+        if self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
         
         return self.serializer_class
     
     def perform_create(self, serializer):
         """Create a new recipe."""
         serializer.save(user=self.request.user) #new recipess created are saved to the current authenticated user
-
-
+    
+    def perform_destroy(self, instance):
+        """Soft delete the recipe, manage.py purge_recipes removes it later."""
+        Recipe.objects.filter(pk=instance.pk).soft_delete()
+        record_change(instance.user_id, [instance.pk]) #update() sends no signals
+    
+    def _requested_ids(self, request):
+        """Return the recipe ids from ?ids=1,2,3 or a POST body, deduplicated."""
+        if request.method == 'GET':
+            ids = request.query_params.get('ids', '')
+            data = {'ids': [i for i in ids.split(',') if i.strip()]}
+        else:
+            data = request.data
+        serializer = serializers.RecipeBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids'])) #dedupe, keep the order
+    
+    @action(methods=['GET', 'POST'], detail=False)
+    def batch(self, request):
+        """Retrieve many recipes by id, listing the ids that were not found.
+        
+        GET takes ?ids=1,2,3, POST takes {"ids": [...]} for long lists.
+        Foreign ids are reported as missing like ids that do not exist.
+        """
+        ids = self._requested_ids(request)
+        
+        #one query for the recipes and one per prefetched relation
+        recipes = Recipe.objects.filter(
+            user=request.user, pk__in=ids
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        result = serializers.RecipeBatchResultSerializer({
+            'results': [recipes[pk] for pk in ids if pk in recipes],
+            'missing': [pk for pk in ids if pk not in recipes],
+        }, context=self.get_serializer_context())
+        
+        return Response(result.data)
+    
+    @action(methods=['GET', 'POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Merge the ingredients of many recipes, e.g. a week's meal plan.
+        
+        Takes the ids like batch. Each recipe is counted once, two queries
+        whatever the number of recipes and ingredients.
+        """
+        ids = self._requested_ids(request)
+        recipes = Recipe.objects.filter(user=request.user, pk__in=ids)
+        totals = recipes.aggregate(
+            found=ArrayAgg('pk'),
+            total_price=Sum('price'),
+            total_time_minutes=Sum('time_minutes'),
+        )
+        found = set(totals.pop('found') or [])
+        #literal ids let Postgres prune the through table partitions
+        ingredients = Ingredient.objects.filter(
+            recipe__in=found
+        ).values('id', 'name').annotate(
+            plan_recipes=Count('recipe')
+        ).order_by('name')
+        result = serializers.ShoppingListSerializer({
+            'recipes': len(found),
+            'missing': [pk for pk in ids if pk not in found],
+            'total_price': totals['total_price'] or 0,
+            'total_time_minutes': totals['total_time_minutes'] or 0,
+            'ingredients': ingredients,
+        })
+        
+        return Response(result.data)
+    
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """List the recipes sharing the most tags and ingredients with this one."""
+        recipe = self.get_object()
+        k = self._param_to_number('k', int)
+        if k is None:
+            k = 10
+        elif not 0 < k <= self.similar_limit:
+            raise ValidationError({'k': f'Must be between 1 and {self.similar_limit}.'})
+        metric = request.query_params.get('metric', 'jaccard')
+        if metric not in self.similarity_metrics:
+            raise ValidationError({'metric': f'Must be one of {", ".join(self.similarity_metrics)}.'})
+        
+        recipes = []
+        for similar, score in similar_recipes(recipe, k, metric):
+            similar.similarity = round(score, 4)
+            recipes.append(similar)
+        serializer = self.get_serializer(recipes, many=True)
+        
+        return Response(serializer.data)
+    
+    @action(methods=['POST'], detail=True)
+    def duplicate(self, request, pk=None):
+        """Copy a recipe with its tags, ingredients and image."""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        copy = recipe.duplicate(**serializer.validated_data)
+        
+        data = serializers.RecipeDetailSerializer(copy, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+    
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe."""
@@ -9,6 +9,16 @@ from django.contrib.auth import (
 from django.utils.translation import gettext as _
 
 from rest_framework import serializers
+from rest_framework.exceptions import APIException
+
+from core.hashers import hashing_slot, HashingBusy
+
+
+class LoginBusy(APIException):
+    """Every password hashing slot of this worker is taken."""
+    status_code = 503
+    default_detail = _('Too many logins in progress, try again shortly.')
+    default_code = 'login_busy'
 
 #json input from API, validates to make sure it is secure & correct & converts to python dictionary
 #or object for the database
@@ -49,11 +59,15 @@ class AuthTokenSerializer(serializers.Serializer):
         """Validate and authenticate the user."""
         email = attrs.get('email')
         password = attrs.get('password')
-        user = authenticate(
-            requests = self.context.get('request'),
-            username=email,
-            password=password
-        )
+        try:
+            with hashing_slot(): #authenticate() hashes the password, cap how many run at once
+                user = authenticate(
+                    request=self.context.get('request'),
+                    username=email,
+                    password=password
+                )
+        except HashingBusy:
+            raise LoginBusy
         if not user:
             msg = _('Unable to authenticate with provided credentials.')
             raise serializers.ValidationError(msg, code='authorization')
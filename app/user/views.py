@@ -2,10 +2,15 @@
 Views for the user API.
 """
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings 
 
+from core.authentication import CachedTokenAuthentication
+from core.throttling import (
+    AnonTokenBucketThrottle,
+    LoginTokenBucketThrottle,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -21,12 +26,14 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer #we customized this to usse email vs username which is default for Django
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES #enable the UI for the token api endpoint
+    authentication_classes = [] #credentials are checked by the serializer, Basic auth would hash twice
+    throttle_classes = [AnonTokenBucketThrottle, LoginTokenBucketThrottle] #every attempt costs a password hash
     
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication] #no DB work on a warm cache
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
@@ -4,7 +4,12 @@ set -e
 
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
+python manage.py build_schema
 python manage.py migrate 
 
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+# The app is preloaded in the master and forked into the workers. uwsgi
+# reads options from UWSGI_* variables, so UWSGI_LAZY_APPS=1 loads it in
+# each worker instead (compare with manage.py profile_imports app.wsgi).
+uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi \
+    --cache2 name=default,items=20000,blocksize=1024,bitmap=1
\ No newline at end of file